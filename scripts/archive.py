@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from os import cpu_count
+from pathlib import Path
+
+from sync import CopyPlan, hash_file
+from zip_writer import (
+    ZIP_DEFLATED,
+    ZIP_STORED,
+    ZipWriter,
+    compress_bytes,
+    compress_file,
+)
+
+ARCHIVE_ROOT = "simulation_files"  # Folder in the archive that holds all files
+LINKS_NAME = ".links.json"  # Maps files that are left out of a deduplicated archive to the file with the same content
+CHECKSUM_SUFFIX = ".sha256"
+STORED_EXTENSIONS = (".png", ".jpg", ".jpeg")  # Formats that are already compressed
+
+
+def write_archive(
+    plan: CopyPlan,
+    archive_file: Path,
+    deduplicate: bool = False,
+    jobs: int | None = None,
+    manifest: dict[str, list] | None = None,
+) -> tuple[int, str]:
+    """
+    Writes all files of the copy plan to a zip archive, without reading the copied files again. Members are sorted by
+    their path and compressed by a pool of jobs threads, while a limited number of compressed members waits to be
+    written in order. Equal input files always give a byte identical archive.
+
+    When deduplicate is set, every unique file content is only stored once and the other files with the same content
+    are listed in a links file, which is used by restore_links to recreate them after unpacking. The content hashes of
+    the manifest are used if the source file did not change since it was copied.
+
+    Returns the number of stored files and the SHA-256 hash of the archive, which is also written to a checksum file
+    next to the archive in the format of sha256sum.
+    """
+    jobs = jobs or cpu_count() or 1
+    files = sorted((str(dst), src) for dst, src in plan.files.items())
+    links: dict[str, str] = {}
+
+    if deduplicate:
+        stored_files: dict[str, str] = {}
+
+        for dst, src in files:
+            file_hash = _get_file_hash(src, (manifest or {}).get(dst))
+            if file_hash in stored_files:
+                links[dst] = stored_files[file_hash]
+            else:
+                stored_files[file_hash] = dst
+
+        files = [(dst, src) for dst, src in files if dst not in links]
+
+    temporary_file = archive_file.with_name(f".{archive_file.name}.tmp")
+
+    with open(temporary_file, "wb") as f, ThreadPoolExecutor(max_workers=jobs) as executor:
+        writer = ZipWriter(f)
+        pending = deque()
+
+        for dst, src in files:
+            method = ZIP_STORED if src.suffix.lower() in STORED_EXTENSIONS else ZIP_DEFLATED
+            pending.append(executor.submit(compress_file, src, f"{ARCHIVE_ROOT}/{dst}", method))
+
+            # Limit the number of compressed members that are kept before they are written
+            if len(pending) > 2 * jobs:
+                writer.write(pending.popleft().result())
+
+        while pending:
+            writer.write(pending.popleft().result())
+
+        if links:
+            links_data = json.dumps(links, indent=1, sort_keys=True).encode("utf-8")
+            writer.write(compress_bytes(links_data, f"{ARCHIVE_ROOT}/{LINKS_NAME}"))
+
+        archive_hash = writer.close()
+
+    os.replace(temporary_file, archive_file)
+
+    checksum_file = archive_file.with_name(archive_file.name + CHECKSUM_SUFFIX)
+    checksum_file.write_text(f"{archive_hash}  {archive_file.name}\n", encoding="utf-8")
+
+    return len(files), archive_hash
+
+
+def _get_file_hash(src: Path, entry: list | None) -> str:
+    if entry is not None:
+        src_path, size, src_mtime, _, file_hash = entry
+        src_stat = src.stat()
+
+        if src_path == str(src) and src_stat.st_size == size and src_stat.st_mtime_ns == src_mtime:
+            return file_hash
+
+    return hash_file(src)
+
+
+def restore_links(folder: Path) -> int:
+    """
+    Recreates the files that were left out of a deduplicated archive, as hard links to the file with the same content.
+    Returns the number of restored files.
+    """
+    links_file = folder / LINKS_NAME
+    if not links_file.is_file():
+        return 0
+
+    with open(links_file, encoding="utf-8") as f:
+        links = json.load(f)
+
+    for file, source in links.items():
+        file_path = folder / file
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+
+        try:
+            os.link(folder / source, file_path)
+        except OSError:
+            shutil.copy2(folder / source, file_path)
+
+    links_file.unlink()
+    return len(links)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Restore the files of an unpacked deduplicated simulation files archive.")
+    parser.add_argument("--restore-links", type=Path, required=True, help="folder that contains the unpacked files")
+    args = parser.parse_args()
+
+    restored_files = restore_links(args.restore_links)
+    print(f"Restored {restored_files} deduplicated files in '{args.restore_links}'.")
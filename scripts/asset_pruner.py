@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+from xml.etree import ElementTree
+
+from material_index import MaterialIndex, parse_material_script
+from mesh_scanner import get_texture_references
+from package_resolver import ResourceNotFound, package_resolver
+from sync import CopyPlan
+from workspace import Workspace
+
+PRUNED_FOLDERS = ("robot_packages", "gzweb")  # Folders in which the files of the robot packages are copied
+KEPT_FILE_NAMES = ("package.xml",)  # Files that are always needed to find a package
+MODEL_FILE_NAMES = ("model.sdf", "model.config")
+SDF_EXTENSIONS = (".sdf", ".world")
+MATERIALS_FOLDER = "materials"  # Folder of a package with the Gazebo material scripts and textures of the package
+
+
+@dataclass
+class PruneReport:
+    kept_files: int = 0
+    pruned_files: dict[PurePosixPath, int] = field(default_factory=dict)  # Size of every pruned file
+
+    @property
+    def pruned_bytes(self) -> int:
+        return sum(self.pruned_files.values())
+
+    def get_pruned_folders(self) -> dict[str, tuple[int, int]]:
+        """
+        Returns the number of pruned files and bytes per package folder, like 'robot_packages/my_robot'.
+        """
+        folders: dict[str, tuple[int, int]] = {}
+
+        for dst, size in self.pruned_files.items():
+            folder = "/".join(dst.parts[:2])
+            count, total_size = folders.get(folder, (0, 0))
+            folders[folder] = (count + 1, total_size + size)
+
+        return folders
+
+    def print_report(self, list_files: bool = False) -> None:
+        print(
+            f"\nPruned {len(self.pruned_files)} unused files ({self.pruned_bytes / 1e6:.1f} MB) of the robot packages,"
+            f" kept {self.kept_files} used files."
+        )
+
+        for folder, (count, size) in sorted(self.get_pruned_folders().items(), key=lambda f: f[1][1], reverse=True):
+            print(f"{folder : <50}{count : >7} files{size / 1e6 : >9.1f}MB")
+
+        if list_files:
+            for dst, size in sorted(self.pruned_files.items()):
+                print(f"  {dst} ({size / 1e3:.1f} kB)")
+
+
+def get_reachable_files(ws: Workspace, vmf: Path) -> set[str]:
+    """
+    Returns the files that are used by the worlds of the virtual maize field and the robot: the world, model, mesh,
+    material and texture files they use and the files those files use, transitively. Materials of the robot that are
+    only used by name are looked up in the materials folders of the used packages. Paths are normalised, but
+    symbolic links are not resolved, like the paths in a copy plan.
+    """
+    model_folders = {f.parent.name: f.parent for f in ws.files.find_by_name("model.sdf")}
+
+    pending = sorted((vmf / "worlds").glob("*.world"))
+    for reference in ws.get_robot_descriptions():
+        pending.append(reference.file)
+        pending.extend(ws.graph.get_dependencies(reference.file)[1])
+
+    # The robot uses material scripts by their URIs, or only by name from the materials folder of a used package
+    urdfs = ws.get_all_used_xacro_files()
+    for urdf in urdfs:
+        pending.extend(filter(None, (_resolve_uri(uri, urdf.urdf_file, model_folders) for uri in urdf.material_uris)))
+
+    material_names = {name for urdf in urdfs for name in urdf.material_names if name}
+    for package in ws.get_all_dependend_packages():
+        material_folder = Path(package_resolver.get_path(package)) / MATERIALS_FOLDER
+        if material_names and material_folder.is_dir():
+            pending.extend(MaterialIndex(material_folder).get_files(material_names))
+
+    reachable = set()
+
+    while pending:
+        file = Path(os.path.normpath(pending.pop()))
+        if str(file) in reachable:
+            continue
+
+        # Folders, like the scripts folder of a material, are used completely
+        if file.is_dir():
+            reachable.add(str(file))
+            pending.extend(f for f in file.rglob("*") if f.is_file())
+            continue
+
+        if not file.is_file():
+            continue
+
+        reachable.add(str(file))
+        suffix = file.suffix.lower()
+
+        try:
+            if suffix in SDF_EXTENSIONS:
+                pending.extend(_get_sdf_references(ws, file, model_folders))
+            elif suffix == ".dae":
+                pending.extend(file.parent / t.replace("file://", "") for t in get_texture_references(file))
+            elif suffix == ".material":
+                pending.extend(_get_material_textures(file))
+
+        except (OSError, ElementTree.ParseError, SyntaxError):
+            # Files that cannot be read are kept, but the files they use cannot be found
+            continue
+
+    return reachable
+
+
+def prune_plan(plan: CopyPlan, ws: Workspace) -> PruneReport:
+    """
+    Removes the files of the robot packages from a copy plan that are not used by the worlds or the robot. The
+    package manifests are always kept.
+    """
+    vmf = Path(package_resolver.get_path("virtual_maize_field"))
+    reachable = get_reachable_files(ws, vmf)
+    package_folders = {Path(package_resolver.get_path(p)) for p in ws.get_all_dependend_packages()}
+    package_destinations = {(folder, f.name) for folder in PRUNED_FOLDERS for f in package_folders}
+    report = PruneReport()
+
+    for dst, src in list(plan.files.items()):
+        if tuple(dst.parts[:2]) not in package_destinations or not any(f in src.parents for f in package_folders):
+            continue
+
+        if src.name in KEPT_FILE_NAMES or os.path.normpath(src) in reachable:
+            report.kept_files += 1
+            continue
+
+        report.pruned_files[dst] = src.stat().st_size
+        del plan.files[dst]
+
+    return report
+
+
+def _get_sdf_references(ws: Workspace, file: Path, model_folders: dict[str, Path]) -> list[Path]:
+    references = []
+
+    for uri in ws.scan_world_file(file).uris:
+        path = _resolve_uri(uri, file, model_folders)
+
+        if path is None:
+            continue
+
+        # Included models only use their model files, other folders like material scripts are used completely
+        if (path / "model.sdf").is_file():
+            references.extend(path / name for name in MODEL_FILE_NAMES)
+        elif path.is_dir():
+            references.extend(f for f in path.rglob("*") if f.is_file())
+        else:
+            references.append(path)
+
+    return references
+
+
+def _resolve_uri(uri: str, file: Path, model_folders: dict[str, Path]) -> Path | None:
+    scheme, _, path = uri.partition("://")
+
+    if not path:
+        return file.parent / uri if uri else None
+
+    if scheme == "model":
+        model_name, _, relative_path = path.partition("/")
+        model_folder = model_folders.get(model_name)
+        return model_folder / relative_path if model_folder is not None else None
+
+    if scheme == "package":
+        package_name, _, relative_path = path.partition("/")
+        try:
+            return Path(package_resolver.get_path(package_name)) / relative_path
+        except ResourceNotFound:
+            return None
+
+    # Relative file URIs are resolved by Gazebo in its own resource folders
+    if scheme == "file" and path.startswith("/"):
+        return Path(path)
+
+    return None
+
+
+def _get_material_textures(file: Path) -> list[Path]:
+    textures = []
+
+    for material in parse_material_script(file, file.name):
+        for texture in material.textures:
+            # Textures are placed next to the scripts or in the textures folder next to the scripts folder
+            textures.extend([file.parent / texture, file.parent.parent / "textures" / texture])
+
+    return textures
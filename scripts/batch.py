@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import json
+import os
+import pathlib
+import traceback
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from dataclasses import asdict, dataclass, field
+from time import perf_counter
+
+from archive import CHECKSUM_SUFFIX, write_archive
+from copy_simulation_files import gather_and_copy_files, get_run_inputs
+from fingerprint import RunFingerprint
+from package_resolver import ResourceNotFound, package_resolver
+from sync import BLOB_FOLDER_NAME, MANIFEST_NAME, read_manifest, remove_unused_blobs
+from validator import ValidationResult, validator
+from workspace import URDF, Workspace
+
+SUMMARY_NAME = "summary.json"
+
+
+@dataclass
+class Team:
+    name: str
+    src_folder: pathlib.Path
+    optenv_settings: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def parse(cls, spec: str) -> Team:
+        """
+        Creates a team from 'NAME=WORKSPACE' or 'WORKSPACE', in which case the name of the workspace folder is used.
+        The 'src' folder of the workspace is used if it exists.
+        """
+        name, _, folder = spec.rpartition("=")
+        src_folder = pathlib.Path(folder).resolve()
+
+        if (src_folder / "src").is_dir():
+            src_folder = src_folder / "src"
+
+        if not src_folder.is_dir():
+            raise ValueError(f"Workspace '{folder}' does not exist")
+
+        if not name:
+            name = src_folder.parent.name if src_folder.name == "src" else src_folder.name
+
+        if name.startswith(".") or "/" in name:
+            raise ValueError(f"Invalid team name '{name}'")
+
+        return cls(name, src_folder)
+
+
+@dataclass
+class TeamResult:
+    name: str
+    result: str = "error"  # One of 'valid', 'invalid', 'up to date' or 'error'
+    failed_checks: list[str] = field(default_factory=list)
+    message: str = ""
+    files: int = 0
+    size: int = 0
+    seconds: float = 0.0
+    archive_hash: str | None = None
+
+
+def package_team(team: Team, output_folder: pathlib.Path, zip_files: bool = False, force: bool = False) -> TeamResult:
+    """
+    Validates the workspace of a team and copies its simulation files to a folder in the output folder, which is run
+    in a fresh process for every team by run_team. All output is written to a log file of the team. The copied files are hard links to a blob
+    folder that is shared by all teams, so files that teams have in common, like the virtual maize field, are stored
+    once.
+    """
+    result = TeamResult(team.name)
+    target = output_folder / team.name
+    archive_file = output_folder / f"{team.name}.zip"
+    log_file = output_folder / f"{team.name}.log"
+    start_time = perf_counter()
+
+    try:
+        with open(log_file, "w", encoding="utf-8") as log, redirect_stdout(log):
+            # Packages of the team take precedence over the packages that are shared by all teams
+            ros_package_path = [str(team.src_folder), *filter(None, os.environ.get("ROS_PACKAGE_PATH", "").split(":"))]
+            os.environ["ROS_PACKAGE_PATH"] = ":".join(ros_package_path)
+            os.environ.update(team.optenv_settings)
+            URDF.optenv_settings = team.optenv_settings
+
+            print(f"Using workspace '{team.src_folder}'.")
+            ws = Workspace(team.src_folder)
+            vmf = pathlib.Path(package_resolver.get_path("virtual_maize_field"))
+
+            output_files = [target / MANIFEST_NAME]
+            if zip_files:
+                output_files.extend([archive_file, archive_file.with_name(archive_file.name + CHECKSUM_SUFFIX)])
+
+            fingerprint = RunFingerprint(
+                str(target),
+                [ws.workspace_folder, vmf, ws.get_material_resource_folder(), pathlib.Path(__file__).parent],
+                output_files,
+                {"optenv": team.optenv_settings, "zip": zip_files},
+                ws.ignored_directories,
+            )
+
+            if not force and fingerprint.is_up_to_date():
+                result.result = "up to date"
+                print("Simulation files are up to date, nothing changed since the last run.")
+
+            elif validator.validate_all(ws, collect_all=True):
+                print("\nCopy files:")
+                plan = gather_and_copy_files(
+                    ws, deduplicate=True, target=target, blob_folder=output_folder / BLOB_FOLDER_NAME
+                )
+                result.result = "valid"
+
+                if zip_files:
+                    manifest = read_manifest(target)["files"]
+                    _, result.archive_hash = write_archive(plan, archive_file, manifest=manifest)
+                    print(f"Zipped files to '{archive_file}' (SHA-256: {result.archive_hash}).")
+
+                fingerprint.save(ws.get_used_environment_variables(), get_run_inputs(ws))
+
+            else:
+                result.result = "invalid"
+                result.failed_checks = [
+                    validator.get_name(ck)
+                    for ck, fdbck in validator.feedback.items()
+                    if fdbck.result in (ValidationResult.ERROR, ValidationResult.SKIPPED)
+                ]
+
+        files = read_manifest(target)["files"] if result.result in ("valid", "up to date") else {}
+        result.files = len(files)
+        result.size = sum(entry[1] for entry in files.values())
+
+    except ResourceNotFound as e:
+        result.message = f"Cannot find package '{e.args[0]}'"
+
+    except OSError as e:
+        result.message = str(e)
+
+    # Errors in the workspace of one team, like a world that includes a model that does not exist, should never stop
+    # the other teams
+    except Exception as e:
+        result.result = "error"
+        result.message = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+
+        try:
+            with open(log_file, "a", encoding="utf-8") as log:
+                traceback.print_exc(file=log)
+        except OSError:
+            pass
+
+    result.seconds = perf_counter() - start_time
+    return result
+
+
+def run_team(team: Team, output_folder: pathlib.Path, zip_files: bool = False, force: bool = False) -> TeamResult:
+    """
+    Runs package_team in a new process, so nothing of another team is used, like the resolved packages or the module
+    state of xacro and roslaunch.
+    """
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        return executor.submit(package_team, team, output_folder, zip_files, force).result()
+
+
+def print_summary(results: list[TeamResult]) -> None:
+    print(f"\n{'Team' : <25}{'Result' : <12}{'Files' : >7}{'Size' : >11}{'Time' : >9}  Details")
+
+    for r in results:
+        details = ", ".join(r.failed_checks) or r.message or (r.archive_hash[:16] if r.archive_hash else "")
+        color = "\033[92m" if r.result in ("valid", "up to date") else "\033[91m"
+        print(
+            f"{color}{r.name : <25}{r.result : <12}{r.files : >7}{r.size / 1e6 : >9.1f}MB"
+            f"{r.seconds : >8.1f}s  {details}\033[0m"
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Validate the workspaces of multiple teams and copy the files needed by the simulation of every"
+        " team to its own folder."
+    )
+    parser.add_argument(
+        "workspaces",
+        nargs="+",
+        metavar="[NAME=]WORKSPACE",
+        help="workspace of a team, the name of the workspace folder is used as team name if no name is given",
+    )
+    parser.add_argument(
+        "-o", "--output", type=pathlib.Path, default=pathlib.Path("teams"), help="folder for the files of all teams"
+    )
+    parser.add_argument(
+        "--optenv",
+        type=pathlib.Path,
+        help='JSON file with the optenv variables of the robot of every team, like {"team": {"ROBOT_CAMERA": 1}}.'
+        " Variables that are not given, and are not set in the environment, are set to 0.",
+    )
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of teams run at the same time")
+    parser.add_argument("--zip", action="store_true", help="zip the files of every team to 'NAME.zip'")
+    parser.add_argument(
+        "--force", action="store_true", help="run all teams, even if nothing changed since their last successful run"
+    )
+    args = parser.parse_args()
+
+    try:
+        teams = [Team.parse(spec) for spec in args.workspaces]
+    except ValueError as e:
+        parser.error(str(e))
+
+    if len({t.name for t in teams}) != len(teams):
+        parser.error("Every team needs a unique name, use NAME=WORKSPACE to name the teams")
+
+    if args.optenv is not None:
+        optenv_settings = json.loads(args.optenv.read_text(encoding="utf-8"))
+        for team in teams:
+            settings = optenv_settings.get(team.name, {})
+            team.optenv_settings = {k: str(int(v) if isinstance(v, bool) else v) for k, v in settings.items()}
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    results = []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(args.jobs, len(teams)))) as executor:
+        futures = {executor.submit(run_team, t, args.output, args.zip, args.force): t for t in teams}
+
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker process itself failed, for example because it ran out of memory
+                result = TeamResult(
+                    futures[future].name, message=f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+                )
+
+            results.append(result)
+
+            sign = "\u2714" if result.result in ("valid", "up to date") else "\u2718"
+            print(f"{sign} {result.name}: {result.result} ({args.output / result.name}.log)")
+
+    # Blobs can only be removed when no team is copied anymore, because they are shared
+    remove_unused_blobs(args.output / BLOB_FOLDER_NAME)
+
+    results.sort(key=lambda r: r.name)
+    print_summary(results)
+
+    with open(args.output / SUMMARY_NAME, "w", encoding="utf-8") as f:
+        json.dump([asdict(r) for r in results], f, indent=2)
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+from argparse import ArgumentParser
+from collections.abc import Callable
+from contextlib import redirect_stdout
+from dataclasses import asdict, dataclass, fields
+from io import StringIO
+from pathlib import Path
+from re import compile
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from types import ModuleType
+from xml.dom import minidom
+
+import disk_cache
+from copy_simulation_files import gather_and_copy_files
+from launch_graph import launch_graph
+from package_resolver import package_resolver
+from validator import validator
+from workspace import URDF, Workspace
+from xacro_cache import xacro_cache
+
+BENCHMARK_VERSION = 2
+DEFAULT_REPEAT = 3
+FIND_REGEX = compile(r"\$\(find\s+([^\s)]+)\)")
+
+_COLLADA_TEMPLATE = """<?xml version="1.0"?>
+<COLLADA xmlns="http://www.collada.org/2005/11/COLLADASchema" version="1.4.1">
+  <library_images><image id="texture"><init_from>../materials/textures/texture.png</init_from></image></library_images>
+  <library_geometries><geometry id="mesh"><mesh><source id="positions"><float_array id="values" count="{count}">{values}</float_array></source></mesh></geometry></library_geometries>
+  <library_visual_scenes><visual_scene id="scene"><node><instance_geometry url="#mesh"/></node></visual_scene></library_visual_scenes>
+  <scene><instance_visual_scene url="#scene"/></scene>
+</COLLADA>
+"""
+_XACRO_TEMPLATE = """<?xml version="1.0"?>
+<robot xmlns:xacro="http://www.ros.org/wiki/xacro" name="{name}">
+{content}
+</robot>
+"""
+
+
+@dataclass
+class WorkspaceConfig:
+    """
+    Size of a synthetic workspace. Every robot package has a xacro file that includes a chain of include_depth xacro
+    files, which each use a mesh of the package itself and of the next package.
+    """
+
+    packages: int = 5
+    include_depth: int = 3
+    launch_files: int = 5
+    models: int = 20
+    worlds: int = 1
+    meshes_per_model: int = 2
+    mesh_size: int = 50_000  # Approximate size of every COLLADA file in bytes
+    texture_size: int = 20_000  # Size of every texture in bytes
+
+
+def generate_workspace(root: Path, config: WorkspaceConfig) -> Path:
+    """
+    Creates a catkin workspace with a virtual_maize_field package and robot packages in root, together with a Gazebo
+    resource folder. Returns the 'src' folder of the workspace.
+    """
+    src = root / "src"
+    vmf = src / "virtual_maize_field"
+
+    _write_package(vmf, "virtual_maize_field")
+    for folder in ("Media/models", "map", "rviz", "gt", "launch"):
+        (vmf / folder).mkdir(parents=True, exist_ok=True)
+
+    (vmf / "Media/models/readme.txt").write_text("Synthetic media\n")
+    (vmf / "map/map.yaml").write_text("image: map.png\n")
+    (vmf / "rviz/config.rviz").write_text("Panels: []\n")
+    (vmf / "gt/gt.csv").write_text("x,y\n")
+
+    for i in range(config.models):
+        model = vmf / "models" / f"model_{i}"
+        (model / "materials/textures").mkdir(parents=True)
+        (model / "materials/textures/texture.png").write_bytes(os.urandom(config.texture_size))
+        (model / "model.config").write_text(f"<model><name>model_{i}</name><sdf>model.sdf</sdf></model>\n")
+
+        visuals = []
+        for j in range(config.meshes_per_model):
+            _write_mesh(model / "meshes" / f"mesh_{j}.dae", config.mesh_size)
+            visuals.append(
+                f'<visual name="visual_{j}"><geometry><mesh><uri>model://model_{i}/meshes/mesh_{j}.dae</uri></mesh>'
+                "</geometry></visual>"
+            )
+
+        (model / "model.sdf").write_text(
+            f'<sdf version="1.6"><model name="model_{i}"><link name="link">{"".join(visuals)}</link></model></sdf>\n'
+        )
+
+    includes = "".join(f"<include><uri>model://model_{i}</uri></include>" for i in range(config.models))
+    for i in range(config.worlds):
+        name = "generated" if i == 0 else f"generated_{i}"
+        (vmf / "worlds").mkdir(exist_ok=True)
+        (vmf / "worlds" / f"{name}.world").write_text(
+            f'<sdf version="1.6"><world name="default">{includes}</world></sdf>\n'
+        )
+
+    for i in range(config.packages):
+        _write_robot_package(src / f"robot_{i}", i, config)
+
+    for i in range(config.launch_files):
+        package = src / f"robot_{i % config.packages}"
+        (package / "launch").mkdir(exist_ok=True)
+        (package / "launch" / f"robot_{i}.launch").write_text(
+            "<launch>\n"
+            f'  <param name="robot_description" command="xacro $(find {package.name})/urdf/robot.urdf.xacro"/>\n'
+            "</launch>\n"
+        )
+
+    # The simulation launch file includes the launch files of all robots
+    includes = "".join(
+        f'  <include file="$(find robot_{i % config.packages})/launch/robot_{i}.launch"/>\n'
+        for i in range(config.launch_files)
+    )
+    (vmf / "launch/simulation.launch").write_text(f"<launch>\n{includes}</launch>\n")
+
+    scripts = root / "gazebo/media/materials/scripts"
+    scripts.mkdir(parents=True)
+    (scripts / "gazebo.material").write_text("material Gazebo/Grey\n{\n}\n")
+
+    return src
+
+
+def _write_package(folder: Path, name: str) -> None:
+    folder.mkdir(parents=True, exist_ok=True)
+    (folder / "package.xml").write_text(f'<?xml version="1.0"?>\n<package format="2"><name>{name}</name></package>\n')
+
+
+def _write_mesh(file: Path, size: int) -> None:
+    count = max(1, size // 10)
+    file.parent.mkdir(parents=True, exist_ok=True)
+    file.write_text(_COLLADA_TEMPLATE.format(count=count, values=" ".join(["0.123456789"] * count)))
+
+
+def _write_robot_package(folder: Path, index: int, config: WorkspaceConfig) -> None:
+    name = f"robot_{index}"
+    next_name = f"robot_{(index + 1) % config.packages}"
+    _write_package(folder, name)
+
+    for depth in range(config.include_depth + 1):
+        _write_mesh(folder / "meshes" / f"part_{depth}.dae", config.mesh_size)
+
+    for depth in range(config.include_depth, -1, -1):
+        content = [
+            f'  <link name="{name}_part_{depth}"><visual><geometry>'
+            f'<mesh filename="package://{name}/meshes/part_{depth}.dae"/></geometry></visual></link>',
+            f'  <link name="{name}_next_{depth}"><visual><geometry>'
+            f'<mesh filename="package://{next_name}/meshes/part_{depth}.dae"/></geometry></visual></link>',
+        ]
+
+        if depth < config.include_depth:
+            content.append(f'  <xacro:include filename="$(find {name})/urdf/part_{depth + 1}.urdf.xacro"/>')
+
+        if depth == 0:
+            content.append('  <gazebo><plugin name="camera" filename="libgazebo_ros_camera.so"/></gazebo>')
+
+        file_name = "robot.urdf.xacro" if depth == 0 else f"part_{depth}.urdf.xacro"
+        (folder / "urdf").mkdir(exist_ok=True)
+        (folder / "urdf" / file_name).write_text(_XACRO_TEMPLATE.format(name=name, content="\n".join(content)))
+
+
+def install_xacro_shim() -> bool:
+    """
+    Makes the xacro files of the synthetic workspace expandable when xacro of ROS 1 cannot be used, which needs
+    roslaunch and rospkg to resolve '$(find)'. The shim only supports includes and '$(find)', which is all the synthetic
+    workspace uses, and finds packages with the package resolver. Returns whether the shim is used.
+    """
+    try:
+        import roslaunch.substitution_args  # noqa: F401
+        import rospkg  # noqa: F401
+        import xacro  # noqa: F401
+
+        return False
+
+    except ImportError:
+        pass
+
+    shim = ModuleType("xacro")
+    shim.all_includes = []
+
+    def process_file(file: str, **kwargs: object) -> minidom.Document:
+        document = minidom.parse(file)
+        _expand_includes(document.documentElement, shim.all_includes)
+        return document
+
+    shim.process_file = process_file
+    sys.modules["xacro"] = shim
+    return True
+
+
+def _expand_includes(element: minidom.Element, all_includes: list[str]) -> None:
+    for child in list(element.childNodes):
+        if child.nodeType != child.ELEMENT_NODE:
+            continue
+
+        if child.tagName != "xacro:include":
+            _expand_includes(child, all_includes)
+            continue
+
+        file = FIND_REGEX.sub(lambda m: package_resolver.get_path(m.group(1)), child.getAttribute("filename"))
+        all_includes.append(file)
+
+        # The content of the included robot replaces the include tag
+        included_root = minidom.parse(file).documentElement
+        _expand_includes(included_root, all_includes)
+
+        for included_child in list(included_root.childNodes):
+            element.insertBefore(included_child, child)
+        element.removeChild(child)
+
+
+class Benchmark:
+    """
+    Times the stages of copy_simulation_files.py on a synthetic workspace. Every repetition starts with an empty
+    in-memory state, the first repetition also starts with empty disk caches when they are enabled.
+    """
+
+    def __init__(self, root: Path, repeat: int = DEFAULT_REPEAT, disk_cache_enabled: bool = False) -> None:
+        self.root = root
+        self.repeat = repeat
+        self.disk_cache_enabled = disk_cache_enabled
+        self.samples: dict[str, list[float]] = {}
+        self.peak_rss: dict[str, int] = {}
+        self.peak_rss_per_stage = reset_peak_rss()  # Otherwise the peak of a stage includes all earlier stages
+
+    def run(self) -> None:
+        # Keep the caches and environment of the user out of the measurements
+        disk_cache.CACHE_FOLDER = self.root / "cache"
+        package_resolver.use_cache = self.disk_cache_enabled
+        xacro_cache.use_cache = self.disk_cache_enabled
+        launch_graph.use_cache = self.disk_cache_enabled
+        os.environ["ROS_PACKAGE_PATH"] = str(self.root / "src")
+        os.environ["GAZEBO_RESOURCE_PATH"] = str(self.root / "gazebo")
+        os.environ.pop("ROS_ROOT", None)
+
+        for _ in range(self.repeat):
+            package_resolver.clear()
+            launch_graph.clear()
+            shutil.rmtree(self.root / "simulation_files", ignore_errors=True)
+
+            ws = self._measure("Workspace.resolve", Workspace.resolve)
+            self._measure("Workspace.get_all_used_model_files", ws.get_all_used_model_files)
+            self._measure("Workspace.get_all_dependend_packages", ws.get_all_dependend_packages)
+
+            xacro_files = sorted((self.root / "src").glob("robot_*/urdf/robot.urdf.xacro"))
+            self._measure("URDF.get_all_dependencies", lambda: [URDF.get_all_dependencies(f) for f in xacro_files])
+
+            # Run the checks on a new workspace, so they do not use the results of the stages above
+            ws = Workspace(ws.workspace_folder)
+            for ck in validator.validation_checks:
+                self._measure(f"validator.{ck.__name__}", lambda: ck(ws))
+
+            target = self.root / "simulation_files"
+            self._measure("gather_and_copy_files", lambda: gather_and_copy_files(ws, target=target))
+            self._measure("gather_and_copy_files (unchanged)", lambda: gather_and_copy_files(ws, target=target))
+
+    def _measure(self, name: str, f: Callable[[], object]) -> object:
+        reset_peak_rss()
+
+        with redirect_stdout(StringIO()):
+            start_time = perf_counter()
+            result = f()
+            duration = perf_counter() - start_time
+
+        self.samples.setdefault(name, []).append(duration)
+        self.peak_rss[name] = max(self.peak_rss.get(name, 0), get_peak_rss())
+        return result
+
+    def get_results(self, config: WorkspaceConfig) -> dict:
+        return {
+            "version": BENCHMARK_VERSION,
+            "commit": get_commit(),
+            "python": platform.python_version(),
+            "config": asdict(config),
+            "repeat": self.repeat,
+            "disk_cache": self.disk_cache_enabled,
+            "peak_rss_per_stage": self.peak_rss_per_stage,
+            "stages": {
+                name: {"min": min(s), "median": median(s), "samples": s, "peak_rss_kb": self.peak_rss[name]}
+                for name, s in self.samples.items()
+            },
+            "peak_rss_kb": get_peak_rss(),
+        }
+
+
+def reset_peak_rss() -> bool:
+    # Linux can reset the peak resident set size of a process, the peak of getrusage can only go up
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+
+    return True
+
+
+def get_peak_rss() -> int:
+    """
+    Returns the peak resident set size in kB since the last reset, or since the start of the process if the peak
+    cannot be reset.
+    """
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+
+    # Process pools are used by some stages, so include the memory used by finished child processes
+    own_usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_usage = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own_usage, child_usage)
+
+
+def get_commit() -> str | None:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return result.stdout.strip()
+
+
+def print_results(results: dict, baseline: dict | None = None) -> None:
+    # Without a reset, the peak of every stage is the peak of the process up to the end of that stage
+    peak_rss_header = "Peak RSS" if results.get("peak_rss_per_stage") else "Total RSS"
+    print(f"{'Stage' : <45}{'Median' : >12}{'Min' : >12}{peak_rss_header : >12}{'Change' : >10}")
+
+    for name, stage in results["stages"].items():
+        change = ""
+        if baseline is not None and name in baseline["stages"] and baseline["stages"][name]["median"] > 0:
+            change = f"{(stage['median'] / baseline['stages'][name]['median'] - 1) * 100:+.0f}%"
+
+        print(
+            f"{name : <45}{stage['median'] * 1000 : >10.1f}ms{stage['min'] * 1000 : >10.1f}ms"
+            f"{stage['peak_rss_kb'] / 1024 : >10.1f}MB{change : >10}"
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Measure the scripts on a synthetic workspace, without a ROS installation.")
+    for config_field in fields(WorkspaceConfig):
+        parser.add_argument(
+            f"--{config_field.name.replace('_', '-')}",
+            type=int,
+            default=config_field.default,
+            help=f"{config_field.name.replace('_', ' ')} of the synthetic workspace (default: {config_field.default})",
+        )
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="number of times every stage is measured")
+    parser.add_argument("--disk-cache", action="store_true", help="use the caches that are kept between runs")
+    parser.add_argument("--workspace", type=Path, help="folder in which the synthetic workspace is kept")
+    parser.add_argument("-o", "--output", type=Path, help="write the results to a JSON file")
+    parser.add_argument("--compare", type=Path, help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    config = WorkspaceConfig(**{f.name: getattr(args, f.name) for f in fields(WorkspaceConfig)})
+
+    with TemporaryDirectory(prefix="fre_benchmark_") as temporary_folder:
+        root = args.workspace if args.workspace is not None else Path(temporary_folder)
+        if not (root / "src").is_dir():
+            generate_workspace(root, config)
+
+        if install_xacro_shim():
+            print(
+                "The xacro of ROS 1 cannot be used, the xacro files are expanded by a shim that only supports includes."
+            )
+
+        benchmark = Benchmark(root, args.repeat, args.disk_cache)
+        benchmark.run()
+
+    results = benchmark.get_results(config)
+    baseline = None
+
+    if args.compare is not None:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print_results(results, baseline)
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
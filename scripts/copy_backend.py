@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import errno
+import os
+from collections import Counter
+from fcntl import ioctl
+from pathlib import Path
+from shutil import copystat
+from threading import Lock
+
+FICLONE = 0x40049409  # ioctl request to share the data blocks of a file (reflink), from linux/fs.h
+COPY_BACKENDS = {
+    "auto": ("reflink", "copy_file_range", "sendfile", "python"),
+    "reflink": ("reflink", "python"),
+    "copy_file_range": ("copy_file_range", "python"),
+    "sendfile": ("sendfile", "python"),
+    "python": ("python",),
+}  # Copy methods that are tried in order, the last method always works
+
+_BUFFER_SIZE = 1024 * 1024
+_MAX_CHUNK_SIZE = 1024 * 1024 * 1024
+_UNSUPPORTED_ERRNOS = {
+    errno.EBADF,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.ENOTSUP,
+    errno.ENOTTY,
+    errno.EOPNOTSUPP,
+    errno.EPERM,
+    errno.EXDEV,
+}  # Errors that mean a copy method is not supported between two file systems
+
+
+def _reflink(src_fd: int, dst_fd: int, size: int) -> None:
+    ioctl(dst_fd, FICLONE, src_fd)
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, size: int) -> None:
+    copied = 0
+    while copied < size:
+        n = os.copy_file_range(src_fd, dst_fd, min(size - copied, _MAX_CHUNK_SIZE))
+        if n == 0:
+            break
+        copied += n
+
+
+def _sendfile(src_fd: int, dst_fd: int, size: int) -> None:
+    copied = 0
+    while copied < size:
+        n = os.sendfile(dst_fd, src_fd, copied, min(size - copied, _MAX_CHUNK_SIZE))
+        if n == 0:
+            break
+        copied += n
+
+
+def _read_write(src_fd: int, dst_fd: int, size: int) -> None:
+    while True:
+        buffer = os.read(src_fd, _BUFFER_SIZE)
+        if not buffer:
+            break
+
+        view = memoryview(buffer)
+        while view:
+            view = view[os.write(dst_fd, view) :]
+
+
+COPY_METHODS = {
+    "reflink": _reflink,
+    "copy_file_range": _copy_file_range,
+    "sendfile": _sendfile,
+    "python": _read_write,
+}
+
+
+class CopyBackend:
+    """
+    Copies files with the fastest method that works between the source and destination file systems. A method that
+    fails because it is not supported is not tried again for the same pair of file systems. Instances can be used
+    from multiple threads.
+    """
+
+    def __init__(self, name: str = "auto") -> None:
+        if name not in COPY_BACKENDS:
+            raise ValueError(f"Unknown copy backend '{name}', choose from {', '.join(COPY_BACKENDS)}")
+
+        self.name = name
+        self.methods = COPY_BACKENDS[name]
+        self.used_methods: Counter[str] = Counter()
+
+        self._unsupported: set[tuple[str, int, int]] = set()
+        self._lock = Lock()
+
+    def copy(self, src: Path, dst: Path) -> None:
+        src_fd = os.open(src, os.O_RDONLY)
+
+        try:
+            src_stat = os.fstat(src_fd)
+            dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+
+            try:
+                dst_device = os.fstat(dst_fd).st_dev
+                method = self._copy_data(src_fd, dst_fd, src_stat.st_size, src_stat.st_dev, dst_device)
+            finally:
+                os.close(dst_fd)
+
+        finally:
+            os.close(src_fd)
+
+        copystat(src, dst)
+
+        with self._lock:
+            self.used_methods[method] += 1
+
+    def _copy_data(self, src_fd: int, dst_fd: int, size: int, src_device: int, dst_device: int) -> str:
+        for method in self.methods:
+            key = (method, src_device, dst_device)
+            if key in self._unsupported and method != self.methods[-1]:
+                continue
+
+            try:
+                COPY_METHODS[method](src_fd, dst_fd, size)
+                return method
+
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED_ERRNOS or method == self.methods[-1]:
+                    raise
+
+                with self._lock:
+                    self._unsupported.add(key)
+
+                # Start again with the next method, part of the data could already be written
+                os.lseek(src_fd, 0, os.SEEK_SET)
+                os.lseek(dst_fd, 0, os.SEEK_SET)
+                os.ftruncate(dst_fd, 0)
+
+        raise RuntimeError("No copy method was able to copy the file")
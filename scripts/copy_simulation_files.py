@@ -1,16 +1,33 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import os
 import pathlib
-import shutil
+from argparse import ArgumentParser, Namespace
+from typing import TYPE_CHECKING
 
-from rospkg import RosPack
-from rospkg.common import ResourceNotFound
-from validator import validator
+from archive import CHECKSUM_SUFFIX, write_archive
+from asset_pruner import prune_plan
+from copy_backend import COPY_BACKENDS, CopyBackend
+from fingerprint import RunFingerprint
+from gzweb_compactor import DEFAULT_MAX_TEXTURE_SIZE, GZWebCompactor
+from material_index import MaterialIndex
+from package_resolver import ResourceNotFound, package_resolver
+from profiler import profiler
+from sync import DEFAULT_COPY_JOBS, MANIFEST_NAME, CopyPlan, SyncSession, read_manifest
+from validator import (
+    ValidationFeedback,
+    ValidationResult,
+    check_dependencies,
+    validator,
+)
+from watcher import watch
 from workspace import Workspace
 
+if TYPE_CHECKING:
+    from validator import ValidationCheck
+
 SIMULATION_ASSETS_FOLDER = pathlib.Path(__file__).parents[1] / "simulation_files"
+SIMULATION_ASSETS_ARCHIVE = pathlib.Path(__file__).parents[1] / "simulation_files.zip"
 VMF_FOLDERS_TO_COPY = (
     "Media",
     "map",
@@ -51,119 +68,364 @@ GAZEBO_EXTENSIONS_TO_KEEP = (
     ".xml",
 )  # File extensions that are needed by Gazebo in the simulation container
 
+PACKAGE_IGNORE_PATTERNS = (
+    ".*",
+    "__pycache__",
+    "build",
+    "devel",
+    "install",
+    "log",
+)  # Files and folders in packages that are never needed in the simulation container
+
+
+def gather_files(ws: Workspace, target: pathlib.Path = SIMULATION_ASSETS_FOLDER) -> CopyPlan:
+    plan = CopyPlan()
+    gather_vmf_files(plan, target)
+    gather_robot_files(plan, ws, target)
+    return plan
+
+
+def gather_vmf_files(plan: CopyPlan, target: pathlib.Path = SIMULATION_ASSETS_FOLDER, verbose: bool = True) -> None:
+    vmf = pathlib.Path(package_resolver.get_path("virtual_maize_field"))
 
-rpack = RosPack()
+    for folder in VMF_FOLDERS_TO_COPY:
+        if verbose:
+            print(f"\033[92m\u2714 {folder} -> {target / folder}\033[0m")
+        plan.add_tree(vmf / folder, folder)
+
+    # Create gzweb assets
+    gzweb_folder = target / "gzweb"
+
+    for folder in GZWEB_VMF_FOLDERS_TO_COPY:
+        if verbose:
+            print(f"\033[92m\u2714 {folder} -> {gzweb_folder}\033[0m")
+        plan.add_tree(vmf / folder, "gzweb", GZWEB_EXTENSIONS_TO_KEEP)
 
 
-def copytree(
-    src: pathlib.Path | str,
-    dst: pathlib.Path | str,
-    symlinks: bool = False,
-    ignore: list[str] | None = None,
+def gather_robot_files(
+    plan: CopyPlan, ws: Workspace, target: pathlib.Path = SIMULATION_ASSETS_FOLDER, verbose: bool = True
 ) -> None:
+    gzweb_folder = target / "gzweb"
+
+    # Copy all custom packages from workspace
+    required_packages = ws.get_all_dependend_packages()
+    for pkg in required_packages:
+        pkg_path = pathlib.Path(package_resolver.get_path(pkg))
+        if (pkg_path / "meshes").is_dir():
+            if verbose:
+                print(f"\033[92m\u2714 {pkg_path} -> {gzweb_folder}\033[0m")
+            plan.add_tree(pkg_path, f"gzweb/{pkg_path.name}", GZWEB_EXTENSIONS_TO_KEEP, PACKAGE_IGNORE_PATTERNS)
+
+    # Copy all custom packages from workspace to robot packages folder, they are needed to start Gazebo
+    robot_packages_folder = target / "robot_packages"
+
+    for pkg in required_packages:
+        pkg_path = pathlib.Path(package_resolver.get_path(pkg))
+        if verbose:
+            print(f"\033[92m\u2714 {pkg_path} -> {robot_packages_folder}\033[0m")
+        plan.add_tree(pkg_path, f"robot_packages/{pkg_path.name}", GAZEBO_EXTENSIONS_TO_KEEP, PACKAGE_IGNORE_PATTERNS)
+
+    # Copy the Gazebo material scripts and textures that are used, including those of all models GZWeb loads
+    gazebo_material_resources = ws.get_material_resource_folder()
+    material_names = ws.get_used_material_names().union(get_staged_material_names(plan, ws))
+    material_files = MaterialIndex(gazebo_material_resources).get_files(material_names)
+    if verbose:
+        print(
+            f"\033[92m\u2714 {gazebo_material_resources} ({len(material_files)} used files) ->"
+            f" {gzweb_folder}/materials/scripts\033[0m"
+        )
+
+    for material_file in material_files:
+        if material_file.suffix.lower() in GZWEB_EXTENSIONS_TO_KEEP:
+            relative_file = material_file.relative_to(gazebo_material_resources).as_posix()
+            plan.add_file(material_file, f"gzweb/materials/scripts/{relative_file}")
+
+
+def get_staged_material_names(plan: CopyPlan, ws: Workspace) -> set[str]:
     """
-    Source: https://stackoverflow.com/questions/1868714/how-do-i-copy-an-entire-directory-of-files-into-an-existing-directory-using-pyth
+    Returns the names of the Gazebo materials used by the models in the GZWeb assets of the plan. GZWeb loads all of
+    these models, also the models that the world does not use.
     """
-    if not os.path.exists(dst):
-        os.makedirs(dst)
-    for item in os.listdir(src):
-        s = os.path.join(src, item)
-        d = os.path.join(dst, item)
-        if os.path.isdir(s):
-            copytree(s, d, symlinks, ignore)
-        else:
-            if not os.path.exists(d) or os.stat(s).st_mtime - os.stat(d).st_mtime > 1:
-                shutil.copy2(s, d)
+    material_names = set()
+
+    for dst, src in plan.files.items():
+        if dst.parts[0] == "gzweb" and dst.suffix == ".sdf":
+            material_names.update(ws.scan_world_file(src).material_names)
 
+    material_names.discard("")
+    return material_names
 
-def remove_empty_directories(path: pathlib.Path | str, remove_root: bool = True) -> None:
+
+def validate_and_stage_files(
+    ws: Workspace,
+    session: SyncSession,
+    jobs: int = 1,
+    collect_all: bool = False,
+    prune: bool = False,
+    max_texture_size: int | None = None,
+) -> bool:
     """
-    Source: https://jacobtomlinson.dev/posts/2014/python-script-recursively-remove-empty-folders/directories/
+    Validates the workspace while the files that are copied anyway are staged in the sync session: the files of the
+    virtual maize field right away and the materials and robot packages as soon as the dependencies of the robot are
+    found. The target folder only changes when the session is committed, so nothing changes when validation fails.
     """
-    if not os.path.isdir(path):
-        return
 
-    # remove empty subfolders
-    files = os.listdir(path)
-    if len(files):
-        for f in files:
-            full_path = os.path.join(path, f)
-            if os.path.isdir(full_path):
-                remove_empty_directories(full_path)
+    def stage(plan: CopyPlan) -> None:
+        # Compacted GZWeb assets are only made after validation
+        session.stage(
+            {dst: src for dst, src in plan.files.items() if max_texture_size is None or dst.parts[0] != "gzweb"}
+        )
 
-    # if folder empty, delete it
-    files = os.listdir(path)
-    if len(files) == 0 and remove_root:
-        os.rmdir(path)
+    def stage_robot_files(ck: ValidationCheck, fdbck: ValidationFeedback) -> None:
+        if ck is not check_dependencies or fdbck.result != ValidationResult.OK:
+            return
 
+        # The materials of the staged models of the virtual maize field are needed as well
+        plan = CopyPlan()
+        for dst, src in vmf_plan.files.items():
+            plan.add_file(src, dst)
 
-def gather_and_copy_files(ws: Workspace) -> None:
-    vmf = pathlib.Path(rpack.get_path("virtual_maize_field"))
+        try:
+            gather_robot_files(plan, ws, session.target, verbose=False)
+            if prune:
+                prune_plan(plan, ws)
 
-    for folder in VMF_FOLDERS_TO_COPY:
-        print(f"\033[92m\u2714 {folder} -> {SIMULATION_ASSETS_FOLDER / folder}\033[0m")
-        copytree(vmf / folder, SIMULATION_ASSETS_FOLDER / folder)
+        # The files are gathered again after validation, which reports the error
+        except (OSError, SyntaxError, KeyError, ResourceNotFound):
+            return
 
-    # Create gzweb assets
-    gzweb_folder = SIMULATION_ASSETS_FOLDER / "gzweb"
-    gzweb_folder.mkdir()
+        stage(plan)
 
-    for folder in GZWEB_VMF_FOLDERS_TO_COPY:
-        print(f"\033[92m\u2714 {folder} -> {gzweb_folder}\033[0m")
-        copytree(vmf / folder, gzweb_folder)
+    vmf_plan = CopyPlan()
+    gather_vmf_files(vmf_plan, session.target, verbose=False)
+    stage(vmf_plan)
 
-    # Copy additional Gazebo resources
-    gazebo_material_resources = ws.get_material_resource_folder()
-    print(f"\033[92m\u2714 {gazebo_material_resources} ->" f" {gzweb_folder}/materials/scripts\033[0m")
-    copytree(gazebo_material_resources, gzweb_folder / "materials/scripts")
+    return validator.validate_all(ws, jobs=jobs, collect_all=collect_all, on_feedback=stage_robot_files)
 
-    # Copy all custom packages from workspace
-    required_packages = ws.get_all_dependend_packages()
-    for pkg in required_packages:
-        pkg_path = pathlib.Path(rpack.get_path(pkg))
-        if (pkg_path / "meshes").is_dir():
-            print(f"\033[92m\u2714 {pkg_path} -> {gzweb_folder}\033[0m")
-            copytree(pkg_path, gzweb_folder / pkg_path.name)
 
-    # Cleanup GZWeb assets folder
-    for f in gzweb_folder.glob("**/*"):
-        if f.is_file() and not f.suffix.lower() in GZWEB_EXTENSIONS_TO_KEEP:
-            f.unlink()
-    remove_empty_directories(gzweb_folder)
+def get_run_fingerprint(ws: Workspace, args: Namespace) -> RunFingerprint:
+    vmf = package_resolver.get_path("virtual_maize_field")
+    input_folders = [ws.workspace_folder, pathlib.Path(__file__).parent, pathlib.Path(vmf)]
 
-    # Copy all custom packages from workspace to robot packages folder, they are needed to start Gazebo
-    robot_packages_folder = SIMULATION_ASSETS_FOLDER / "robot_packages"
-    robot_packages_folder.mkdir()
+    try:
+        input_folders.append(ws.get_material_resource_folder())
+    except (EnvironmentError, NotADirectoryError):
+        pass
+
+    output_files = [SIMULATION_ASSETS_FOLDER / MANIFEST_NAME]
+    if args.zip is not None:
+        output_files.extend([args.zip, args.zip.with_name(args.zip.name + CHECKSUM_SUFFIX)])
+
+    options = {
+        "virtual_maize_field": vmf,
+        "dedup": args.dedup,
+        "compact_gzweb": args.compact_gzweb,
+        "zip": args.zip,
+        "prune": args.prune,
+    }
+
+    return RunFingerprint(str(SIMULATION_ASSETS_FOLDER), input_folders, output_files, options, ws.ignored_directories)
+
+
+def get_run_inputs(ws: Workspace) -> list[pathlib.Path]:
+    """
+    Returns the used packages and robot files outside the workspace, which are only known after the workspace was
+    validated, so they are saved with the fingerprint of the run.
+    """
+    package_folders = [pathlib.Path(package_resolver.get_path(p)) for p in ws.get_all_dependend_packages()]
+    files = [node.file for node in ws.graph.nodes] + sorted(ws.graph.resources())
+
+    # Files in the workspace and in the used packages are already part of the fingerprint through their folder
+    folders = [ws.workspace_folder, *package_folders]
+    inputs = [f for f in package_folders if ws.workspace_folder not in f.parents]
+    inputs.extend(f for f in files if not any(folder in f.parents for folder in folders))
+    return inputs
 
-    required_packages = ws.get_all_dependend_packages()
-    for pkg in required_packages:
-        pkg_path = pathlib.Path(rpack.get_path(pkg))
-        print(f"\033[92m\u2714 {pkg_path} -> {robot_packages_folder}\033[0m")
-        copytree(pkg_path, robot_packages_folder / pkg_path.name)
 
-    # Cleanup folder
-    for f in robot_packages_folder.glob("**/*"):
-        if f.is_file() and not f.suffix.lower() in GAZEBO_EXTENSIONS_TO_KEEP:
-            f.unlink()
-    remove_empty_directories(robot_packages_folder)
+def gather_and_copy_files(
+    ws: Workspace,
+    copy_backend: str = "auto",
+    copy_jobs: int = DEFAULT_COPY_JOBS,
+    deduplicate: bool = False,
+    max_texture_size: int | None = None,
+    target: pathlib.Path = SIMULATION_ASSETS_FOLDER,
+    blob_folder: pathlib.Path | None = None,
+    prune: bool = False,
+    session: SyncSession | None = None,
+) -> CopyPlan:
+    with profiler.span("stage", "gather files"):
+        plan = gather_files(ws, target)
+
+    # Leave out the files of the robot packages that are not used by the worlds or the robot
+    if prune:
+        with profiler.span("stage", "prune files"):
+            prune_plan(plan, ws).print_report()
+
+    # Replace the GZWeb assets by smaller variants, the files used by Gazebo stay the same
+    if max_texture_size is not None:
+        with profiler.span("stage", "compact gzweb"):
+            compaction = GZWebCompactor(max_texture_size).compact(plan)
+
+        print(
+            f"\033[92m\u2714 Compacted {compaction.compacted_files} GZWeb assets from"
+            f" {compaction.original_bytes / 1e6:.1f} MB to {compaction.compacted_bytes / 1e6:.1f} MB"
+            f" ({compaction.cached_files} reused from cache)\033[0m"
+        )
+
+    # Files that were staged during validation are only copied again when they changed
+    if session is None:
+        session = SyncSession(target, CopyBackend(copy_backend), copy_jobs, deduplicate, blob_folder)
+
+    with profiler.span("stage", "copy files"):
+        stats = session.commit(plan)
+
+    used_methods = ", ".join(f"{method}: {count}" for method, count in session.backend.used_methods.most_common())
+    print(
+        f"\nCopied {stats.copied_files} files ({stats.copied_bytes / 1e6:.1f} MB) in {stats.copy_seconds:.2f} s"
+        f" ({stats.throughput / 1e6:.1f} MB/s{', ' + used_methods if used_methods else ''}), kept"
+        f" {stats.unchanged_files} unchanged files and removed {stats.removed_files} old files."
+    )
+
+    return plan
 
 
 if __name__ == "__main__":
+    parser = ArgumentParser(description="Validate the robot workspace and copy all files needed by the simulation.")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="number of validation checks that are run at the same time"
+    )
+    parser.add_argument(
+        "--collect-all", action="store_true", help="run all validation checks instead of stopping at the first error"
+    )
+    parser.add_argument(
+        "--copy-backend",
+        choices=COPY_BACKENDS,
+        default="auto",
+        help="method used to copy files, 'auto' uses the fastest method supported by the file system",
+    )
+    parser.add_argument(
+        "--copy-jobs", type=int, default=DEFAULT_COPY_JOBS, help="number of files that are copied at the same time"
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="store files with the same content only once, the copied files are hard links to the stored content",
+    )
+    parser.add_argument(
+        "--compact-gzweb",
+        nargs="?",
+        type=int,
+        const=DEFAULT_MAX_TEXTURE_SIZE,
+        metavar="MAX_TEXTURE_SIZE",
+        help=f"downscale GZWeb textures to at most {DEFAULT_MAX_TEXTURE_SIZE} pixels, or the given size, and minify"
+        " GZWeb meshes, so GZWeb loads faster. Textures are only downscaled when Pillow is installed.",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="only copy the files of the robot packages that are used by the worlds or the robot, like meshes,"
+        " textures and models, instead of all files with a supported extension",
+    )
+    parser.add_argument(
+        "--prune-dry-run",
+        action="store_true",
+        help="print the files that --prune leaves out and the bytes saved, without copying any files",
+    )
+    parser.add_argument(
+        "--zip",
+        nargs="?",
+        type=pathlib.Path,
+        const=SIMULATION_ASSETS_ARCHIVE,
+        help=f"zip the copied files, by default to '{SIMULATION_ASSETS_ARCHIVE.name}'. Files with the same content are"
+        " only stored once when combined with --dedup.",
+    )
+    parser.add_argument(
+        "--zip-jobs", type=int, default=None, help="number of files that are compressed at the same time"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="validate and copy the files, even if nothing changed since the last successful run",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running and validate and copy the files again when files in the workspace change",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="measure where the time goes and print the files and checks that take the most time",
+    )
+    parser.add_argument(
+        "--profile-output",
+        type=pathlib.Path,
+        help="write the measurements to a file, as a Chrome trace if the file name ends with '.trace.json'",
+    )
+    args = parser.parse_args()
+
+    profiler.enabled = args.profile or args.profile_output is not None
+    session = None
+
     try:
         ws = Workspace.resolve()
 
         print(f"Using workspace '{ws.workspace_folder}'.")
 
-        valid = validator.validate_all(ws)
+        fingerprint = get_run_fingerprint(ws, args)
+        up_to_date = not args.force and not args.watch and not args.prune_dry_run and fingerprint.is_up_to_date()
 
-        if valid:
-            print("\nRemoving old simulation files...")
-            for f in SIMULATION_ASSETS_FOLDER.glob("*"):
-                if f.is_dir():
-                    shutil.rmtree(f)
+        if up_to_date:
+            valid = False
+            print("Simulation files are up to date, nothing changed since the last run. Use --force to run anyway.")
+
+        elif args.prune_dry_run:
+            with profiler.span("stage", "validation"):
+                valid = validator.validate_all(ws, jobs=args.jobs, collect_all=args.collect_all)
+
+        else:
+            # Copying the files starts during validation, in staging folders next to the current files
+            session = SyncSession(SIMULATION_ASSETS_FOLDER, CopyBackend(args.copy_backend), args.copy_jobs, args.dedup)
 
+            with profiler.span("stage", "validation"):
+                valid = validate_and_stage_files(
+                    ws, session, args.jobs, args.collect_all, args.prune, args.compact_gzweb
+                )
+
+        if valid and args.prune_dry_run:
+            valid = False
+            prune_plan(gather_files(ws), ws).print_report(list_files=True)
+
+        if valid:
             print("\nCopy files:")
-            gather_and_copy_files(ws)
+            plan = gather_and_copy_files(
+                ws, args.copy_backend, args.copy_jobs, args.dedup, args.compact_gzweb, prune=args.prune, session=session
+            )
+            session = None
+
+            if args.zip is not None:
+                manifest = read_manifest(SIMULATION_ASSETS_FOLDER)["files"]
+
+                with profiler.span("stage", "zip files"):
+                    stored_files, archive_hash = write_archive(plan, args.zip, args.dedup, args.zip_jobs, manifest)
+
+                print(f"Zipped {stored_files} files to '{args.zip}' (SHA-256: {archive_hash}).")
+
+            fingerprint.save(ws.get_used_environment_variables(), get_run_inputs(ws))
+
+        if args.watch:
+            watch(
+                ws,
+                lambda ws: gather_and_copy_files(
+                    ws, args.copy_backend, args.copy_jobs, args.dedup, args.compact_gzweb, prune=args.prune
+                ),
+                plan if valid else None,
+                args.jobs,
+            )
+
+    except KeyboardInterrupt:
+        if not args.watch:
+            raise
 
     except NotADirectoryError:
         print(
@@ -177,3 +439,19 @@ if __name__ == "__main__":
             " field package into your workspace and did a 'catkin_make'? Did you source"
             " your workspace?"
         )
+
+    finally:
+        # Files that were staged for a run that failed are never used
+        if session is not None:
+            session.discard()
+
+    if args.profile:
+        profiler.print_report()
+
+    if args.profile_output is not None:
+        if args.profile_output.name.endswith(".trace.json"):
+            profiler.write_chrome_trace(args.profile_output)
+        else:
+            profiler.write_json(args.profile_output)
+
+        print(f"Wrote profile to '{args.profile_output}'.")
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from pathlib import Path
+from threading import RLock
+
+from document_cache import DocumentCache
+
+
+@dataclass(frozen=True)
+class DependencyNode:
+    file: Path
+    packages: tuple[str, ...]
+    resources: tuple[Path, ...]
+    data: object = None  # Information the load function read from the file, which is kept as long as the node
+
+
+class DependencyGraph:
+    """
+    Graph with one node per resolved file and edges to the resource files that file uses. Every file is loaded only
+    once; resources with an extension in follow_extensions are loaded as nodes too. The load_dependencies function
+    returns the packages and resource files that are used directly by a file and any other data of the file that
+    should be kept, so the file does not have to be read again.
+    """
+
+    def __init__(
+        self,
+        documents: DocumentCache,
+        load_dependencies: Callable[[Path, DependencyGraph], tuple[Iterable[str], Iterable[Path], object]],
+        follow_extensions: Iterable[str],
+    ) -> None:
+        self.documents = documents
+        self.follow_extensions = tuple(follow_extensions)
+
+        self._load_dependencies = load_dependencies
+        self._nodes: dict[Path, DependencyNode] = {}
+        self._dependents: dict[Path, set[Path]] = {}
+        self._loading: set[Path] = set()
+        self._closures: dict[Path, tuple[frozenset[str], frozenset[Path]]] = {}
+        self._lock = RLock()
+
+    def __contains__(self, file: Path) -> bool:
+        return file in self._nodes
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    @property
+    def nodes(self) -> list[DependencyNode]:
+        return list(self._nodes.values())
+
+    def add(self, file: Path) -> None:
+        with self._lock:
+            pending = [file]
+
+            while pending:
+                node = self._load_node(pending.pop())
+
+                if node is not None:
+                    pending.extend(r for r in node.resources if self._follow(r) and r not in self._nodes)
+
+    def get_dependencies(self, file: Path) -> tuple[list[str], list[Path]]:
+        packages, resources = self._get_closure(file)
+        return sorted(packages), sorted(resources)
+
+    def get_data(self, file: Path) -> object:
+        """
+        Returns the data that was read when the file was loaded, or None if the file is still loading.
+        """
+        with self._lock:
+            if file not in self._nodes:
+                self.add(file)
+
+            node = self._nodes.get(file)
+            return node.data if node is not None else None
+
+    def packages(self, files: Iterable[Path] | None = None) -> set[str]:
+        packages = set()
+
+        for file in self._nodes if files is None else files:
+            packages.update(self._get_closure(file)[0])
+
+        return packages
+
+    def resources(self, files: Iterable[Path] | None = None) -> set[Path]:
+        resources = set()
+
+        for file in self._nodes if files is None else files:
+            resources.update(self._get_closure(file)[1])
+
+        return resources
+
+    def dependents(self, file: Path) -> set[Path]:
+        dependents = set()
+        pending = [file]
+
+        while pending:
+            for dependent in self._dependents.get(pending.pop(), ()):
+                if dependent not in dependents:
+                    dependents.add(dependent)
+                    pending.append(dependent)
+
+        return dependents
+
+    def find_cycles(self) -> list[list[Path]]:
+        cycles = []
+        finished: set[Path] = set()
+
+        for root in self._nodes:
+            if root in finished:
+                continue
+
+            # Iterative depth first search, a resource that is on the current path closes a cycle
+            path = [root]
+            on_path = {root}
+            iterators = [iter(self._nodes[root].resources)]
+
+            while iterators:
+                resource = next(iterators[-1], None)
+
+                if resource is None:
+                    iterators.pop()
+                    finished.add(path[-1])
+                    on_path.discard(path.pop())
+
+                elif resource in on_path:
+                    cycles.append(path[path.index(resource) :] + [resource])
+
+                elif resource in self._nodes and resource not in finished:
+                    path.append(resource)
+                    on_path.add(resource)
+                    iterators.append(iter(self._nodes[resource].resources))
+
+        return cycles
+
+    def invalidate(self, file: Path) -> None:
+        with self._lock:
+            self._nodes.pop(file, None)
+            self._closures.clear()
+
+            for dependents in self._dependents.values():
+                dependents.discard(file)
+
+    def _follow(self, file: Path) -> bool:
+        return file.suffix.lower() in self.follow_extensions
+
+    def _load_node(self, file: Path) -> DependencyNode | None:
+        # A file that is loaded again while it is still loading includes itself, the cycle is reported by find_cycles
+        if file in self._nodes or file in self._loading:
+            return None
+
+        self._loading.add(file)
+        try:
+            packages, resources, data = self._load_dependencies(file, self)
+        finally:
+            self._loading.discard(file)
+
+        node = DependencyNode(file, tuple(dict.fromkeys(packages)), tuple(dict.fromkeys(resources)), data)
+        self._nodes[file] = node
+        self._closures.clear()
+
+        for resource in node.resources:
+            self._dependents.setdefault(resource, set()).add(file)
+
+        return node
+
+    def _get_closure(self, file: Path) -> tuple[frozenset[str], frozenset[Path]]:
+        with self._lock:
+            if file not in self._nodes:
+                self.add(file)
+
+            if file in self._closures:
+                return self._closures[file]
+
+            packages: set[str] = set()
+            resources: set[Path] = set()
+            pending = [file]
+            visited = {file}
+
+            while pending:
+                node = self._nodes.get(pending.pop())
+                if node is None:
+                    continue
+
+                packages.update(node.packages)
+                resources.update(node.resources)
+
+                for resource in node.resources:
+                    if resource not in visited and self._follow(resource):
+                        visited.add(resource)
+                        pending.append(resource)
+
+            self._closures[file] = (frozenset(packages), frozenset(resources))
+            return self._closures[file]
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import json
+from os import environ, replace
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Any
+
+CACHE_FOLDER = (
+    Path(environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "fre_competition_environment"
+)  # Folder in which caches are kept between runs
+
+
+def read_json(name: str) -> Any | None:
+    try:
+        with open(CACHE_FOLDER / name, encoding="utf-8") as f:
+            return json.load(f)
+
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(name: str, data: Any) -> None:
+    # The cache is only an optimisation, so failing to write it should never stop the scripts
+    try:
+        write_bytes(name, json.dumps(data).encode("utf-8"))
+    except OSError:
+        pass
+
+
+def write_bytes(name: str, data: bytes) -> None:
+    cache_file = CACHE_FOLDER / name
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write to a temporary file first and replace the cache file, so readers never see a partially written file
+    with NamedTemporaryFile(dir=cache_file.parent, prefix=f".{cache_file.name}.", delete=False) as f:
+        try:
+            f.write(data)
+        except OSError:
+            Path(f.name).unlink()
+            raise
+
+    replace(f.name, cache_file)
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from collections.abc import Callable
+from os import stat_result
+from pathlib import Path
+from threading import RLock
+from xml.etree import ElementTree
+
+from profiler import profiler
+
+DEFAULT_MEMORY_LIMIT = 16 * 1024 * 1024  # Approximate number of bytes the parsed documents may use
+_ELEMENT_OVERHEAD = 200  # Approximate number of bytes used by a single Element object
+
+
+class DocumentCache:
+    """
+    Per-run cache of parsed XML documents. Documents are keyed by their resolved path, the kind of parsing (plain XML
+    or an expanded xacro) and the modification time and size of the file, so a file that changes on disk is parsed
+    again. The least recently used documents are evicted when the estimated memory usage exceeds the memory limit,
+    and documents larger than the limit are not kept at all.
+
+    The returned elements are shared between all consumers and should not be modified.
+    """
+
+    def __init__(self, memory_limit: int = DEFAULT_MEMORY_LIMIT) -> None:
+        self.memory_limit = memory_limit
+        self.memory_usage = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._documents: OrderedDict[tuple[Path, str], tuple[int, int, int, ElementTree.Element]] = OrderedDict()
+        self._loading: dict[tuple[Path, str], RLock] = {}
+        self._lock = RLock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def parse(self, file: Path) -> ElementTree.Element:
+        return self.load(file, "xml", lambda: ElementTree.parse(file).getroot())
+
+    def load(self, file: Path, kind: str, loader: Callable[[], ElementTree.Element]) -> ElementTree.Element:
+        key = (file.resolve(), kind)
+        file_stat = file.stat()
+
+        with self._lock:
+            document = self._get(key, file_stat)
+            if document is not None:
+                self.hits += 1
+                return document
+
+            key_lock = self._loading.setdefault(key, RLock())
+
+        # Parse outside of the cache lock, so other documents can be loaded at the same time. The lock of the document
+        # itself makes sure the same document is never loaded twice at the same time.
+        with key_lock:
+            with self._lock:
+                document = self._get(key, file_stat)
+
+            if document is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+                with profiler.span(kind, str(file)):
+                    document = loader()
+
+                with self._lock:
+                    self._put(key, file_stat, document)
+
+        with self._lock:
+            self._loading.pop(key, None)
+
+        return document
+
+    def invalidate(self, file: Path) -> None:
+        resolved_file = file.resolve()
+
+        with self._lock:
+            for key in [k for k in self._documents if k[0] == resolved_file]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._documents.clear()
+            self.memory_usage = 0
+
+    def _get(self, key: tuple[Path, str], file_stat: stat_result) -> ElementTree.Element | None:
+        try:
+            mtime, size, _, document = self._documents[key]
+        except KeyError:
+            return None
+
+        if mtime != file_stat.st_mtime_ns or size != file_stat.st_size:
+            self._remove(key)
+            return None
+
+        self._documents.move_to_end(key)
+        return document
+
+    def _put(self, key: tuple[Path, str], file_stat: stat_result, document: ElementTree.Element) -> None:
+        if key in self._documents:
+            self._remove(key)
+
+        memory_usage = self.estimate_memory_usage(document)
+
+        # Documents that do not fit at all are not kept, like large expanded robot descriptions that are read once
+        if memory_usage > self.memory_limit:
+            return
+
+        self._documents[key] = (file_stat.st_mtime_ns, file_stat.st_size, memory_usage, document)
+        self.memory_usage += memory_usage
+
+        # Evict least recently used documents
+        while self.memory_usage > self.memory_limit:
+            self._remove(next(iter(self._documents)))
+
+    def _remove(self, key: tuple[Path, str]) -> None:
+        _, _, memory_usage, _ = self._documents.pop(key)
+        self.memory_usage -= memory_usage
+
+    @staticmethod
+    def estimate_memory_usage(document: ElementTree.Element) -> int:
+        memory_usage = 0
+
+        for element in document.iter():
+            memory_usage += _ELEMENT_OVERHEAD + len(element.text or "") + len(element.tail or "")
+            memory_usage += sum(len(k) + len(v) for k, v in element.attrib.items())
+
+        return memory_usage
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import os
+from bisect import bisect_left
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+DEFAULT_IGNORED_DIRECTORIES = (
+    ".git",
+    ".hg",
+    ".svn",
+    "__pycache__",
+    "build",
+    "devel",
+    "install",
+    "log",
+    "logs",
+)  # Directory names that never contain files that are used by the simulation
+
+
+class FileIndex:
+    """
+    Index of all files in a folder, created by a single recursive scan. Files can be looked up by their extension or
+    by their name, optionally limited to a sub folder. Directories with a name in ignored_directories are skipped.
+    """
+
+    def __init__(self, root: Path, ignored_directories: Iterable[str] = DEFAULT_IGNORED_DIRECTORIES) -> None:
+        self.root = root
+        self.ignored_directories = frozenset(ignored_directories)
+
+        self._by_extension: dict[str, list[str]] = {}
+        self._by_name: dict[str, list[str]] = {}
+        self.scan()
+
+    def __len__(self) -> int:
+        return sum(len(files) for files in self._by_extension.values())
+
+    def __iter__(self) -> Iterator[Path]:
+        for files in self._by_extension.values():
+            yield from map(Path, files)
+
+    def scan(self) -> None:
+        by_extension: dict[str, list[str]] = {}
+        by_name: dict[str, list[str]] = {}
+
+        visited_directories = set()
+        folders = [str(self.root)]
+
+        while folders:
+            folder = folders.pop()
+
+            try:
+                folder_stat = os.stat(folder)
+                with os.scandir(folder) as entries:
+                    entries = list(entries)
+            except OSError:
+                continue
+
+            # Prevent infinite loops caused by symlinked directories
+            if (folder_stat.st_dev, folder_stat.st_ino) in visited_directories:
+                continue
+            visited_directories.add((folder_stat.st_dev, folder_stat.st_ino))
+
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        if entry.name not in self.ignored_directories:
+                            folders.append(entry.path)
+                        continue
+
+                    if not entry.is_file():
+                        continue
+
+                except OSError:
+                    continue
+
+                by_name.setdefault(entry.name, []).append(entry.path)
+                by_extension.setdefault(os.path.splitext(entry.name)[1], []).append(entry.path)
+
+        # Sorted lists give a stable order and allow looking up all files in a sub folder by bisection
+        for files in (*by_extension.values(), *by_name.values()):
+            files.sort()
+
+        self._by_extension = by_extension
+        self._by_name = by_name
+
+    def find_by_name(self, name: str, folder: Path | None = None) -> list[Path]:
+        return self._find(self._by_name.get(name, []), folder, name)
+
+    def find_by_extension(self, extension: str, folder: Path | None = None) -> list[Path]:
+        return self._find(self._by_extension.get(extension, []), folder, f"*{extension}")
+
+    def _find(self, files: list[str], folder: Path | None, pattern: str) -> list[Path]:
+        if folder is None or folder == self.root:
+            return [Path(f) for f in files]
+
+        if self.root not in folder.parents:
+            return sorted(folder.glob(f"**/{pattern}"))
+
+        prefix = os.path.join(str(folder), "")
+        found_files = []
+
+        for f in files[bisect_left(files, prefix) :]:
+            if not f.startswith(prefix):
+                break
+            found_files.append(Path(f))
+
+        return found_files
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import json
+import os
+from collections.abc import Iterable, Iterator
+from hashlib import sha256
+from pathlib import Path
+
+from disk_cache import read_json, write_json
+from file_index import DEFAULT_IGNORED_DIRECTORIES
+
+CACHE_NAME = "fingerprints.json"
+FINGERPRINT_VERSION = 2
+ENVIRONMENT_VARIABLES = (
+    "ROS_PACKAGE_PATH",
+    "ROS_ROOT",
+    "ROS_DISTRO",
+    "GAZEBO_RESOURCE_PATH",
+)  # Variables that always influence the result of a run
+
+
+class RunFingerprint:
+    """
+    Fingerprint of everything a run depends on: the size and modification time of all files in the input folders, the
+    environment variables that are used and the options of the run. The output files are part of the fingerprint as
+    well, so a run is repeated when its output was changed or removed.
+
+    The input folders and environment are read when the fingerprint is created, so files that change during a run
+    make the next run repeat it. Inputs that are only known after a run, like the used packages outside the input
+    folders, are saved with the fingerprint of the run and read again when the next fingerprint is created.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        input_folders: Iterable[Path],
+        output_files: Iterable[Path],
+        options: dict,
+        ignored_directories: Iterable[str] = DEFAULT_IGNORED_DIRECTORIES,
+    ) -> None:
+        self.key = key
+        self.output_files = list(output_files)
+        self.options = options
+        self.environment = dict(os.environ)
+        self.ignored_directories = set(ignored_directories)
+        self.input_hash = _hash_paths(input_folders, self.ignored_directories)
+
+        last_run = self._get_last_run()
+        self.input_paths: list[str] = last_run.get("input_paths", []) if last_run is not None else []
+        self.input_paths_hash = _hash_paths(map(Path, self.input_paths), self.ignored_directories)
+
+    def is_up_to_date(self) -> bool:
+        last_run = self._get_last_run()
+        if last_run is None:
+            return False
+
+        return last_run["fingerprint"] == self._get_fingerprint(last_run["environment_variables"])
+
+    def save(self, environment_variables: Iterable[str] = (), input_paths: Iterable[Path] = ()) -> None:
+        """
+        Saves the fingerprint after a successful run, together with the environment variables that the run used next
+        to the default variables and the files and folders outside the input folders that the run used.
+        """
+        environment_variables = sorted(set(ENVIRONMENT_VARIABLES).union(environment_variables))
+
+        # Paths that were not read when the fingerprint was created are read now
+        input_paths = sorted(set(map(str, input_paths)))
+        if input_paths != self.input_paths:
+            self.input_paths = input_paths
+            self.input_paths_hash = _hash_paths(map(Path, input_paths), self.ignored_directories)
+
+        fingerprints = read_json(CACHE_NAME)
+        if not isinstance(fingerprints, dict) or fingerprints.get("version") != FINGERPRINT_VERSION:
+            fingerprints = {"version": FINGERPRINT_VERSION, "runs": {}}
+
+        fingerprints["runs"][self.key] = {
+            "fingerprint": self._get_fingerprint(environment_variables),
+            "environment_variables": environment_variables,
+            "input_paths": input_paths,
+        }
+        write_json(CACHE_NAME, fingerprints)
+
+    def _get_last_run(self) -> dict | None:
+        fingerprints = read_json(CACHE_NAME)
+        if not isinstance(fingerprints, dict) or fingerprints.get("version") != FINGERPRINT_VERSION:
+            return None
+
+        return fingerprints["runs"].get(self.key)
+
+    def _get_fingerprint(self, environment_variables: Iterable[str]) -> str:
+        fingerprint = sha256(self.input_hash.encode("utf-8"))
+        fingerprint.update(self.input_paths_hash.encode("utf-8"))
+        environment = {variable: self.environment.get(variable) for variable in environment_variables}
+        fingerprint.update(json.dumps([environment, self.options], sort_keys=True, default=str).encode("utf-8"))
+
+        for file in self.output_files:
+            fingerprint.update(_get_stat_line(file))
+
+        return fingerprint.hexdigest()
+
+
+def _hash_paths(paths: Iterable[Path], ignored_directories: set[str]) -> str:
+    paths_hash = sha256()
+
+    for path in paths:
+        lines = _iter_tree(path, ignored_directories) if path.is_dir() else [_get_stat_line(path)]
+        for line in lines:
+            paths_hash.update(line)
+
+    return paths_hash.hexdigest()
+
+
+def _iter_tree(folder: Path, ignored_directories: set[str]) -> Iterator[bytes]:
+    visited_folders = set()
+    folders = [str(folder)]
+
+    while folders:
+        current_folder = folders.pop()
+
+        try:
+            folder_stat = os.stat(current_folder)
+            with os.scandir(current_folder) as entries:
+                entries = sorted(entries, key=lambda e: e.name)
+        except OSError:
+            yield f"{current_folder}\0missing\n".encode("utf-8", "surrogateescape")
+            continue
+
+        # Prevent infinite loops caused by symlinked directories
+        if (folder_stat.st_dev, folder_stat.st_ino) in visited_folders:
+            continue
+        visited_folders.add((folder_stat.st_dev, folder_stat.st_ino))
+
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    if entry.name not in ignored_directories:
+                        folders.append(entry.path)
+                    continue
+
+                entry_stat = entry.stat()
+            except OSError:
+                continue
+
+            yield f"{entry.path}\0{entry_stat.st_size}\0{entry_stat.st_mtime_ns}\n".encode("utf-8", "surrogateescape")
+
+
+def _get_stat_line(file: Path) -> bytes:
+    try:
+        file_stat = file.stat()
+    except OSError:
+        return f"{file}\0missing\n".encode("utf-8", "surrogateescape")
+
+    return f"{file}\0{file_stat.st_size}\0{file_stat.st_mtime_ns}\n".encode("utf-8", "surrogateescape")
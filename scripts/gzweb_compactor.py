@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from hashlib import sha256
+from io import BytesIO
+from os import cpu_count
+from pathlib import Path
+from types import ModuleType
+from xml.etree import ElementTree
+
+from disk_cache import CACHE_FOLDER, read_json, write_bytes, write_json
+from mesh_scanner import COLLADA_NS
+from sync import CopyPlan, hash_file
+
+COMPACTOR_VERSION = 1
+DEFAULT_MAX_TEXTURE_SIZE = 1024  # Maximum width and height of textures in pixels
+GZWEB_FOLDER = "gzweb"
+MESH_EXTENSIONS = (".dae",)
+TEXTURE_EXTENSIONS = (".png", ".jpg", ".jpeg")  # Texture formats that can be shown by the browser
+UNUSED_LIBRARY_TAGS = (
+    "library_articulated_systems",
+    "library_force_fields",
+    "library_joints",
+    "library_kinematics_models",
+    "library_kinematics_scenes",
+    "library_physics_materials",
+    "library_physics_models",
+    "library_physics_scenes",
+)  # Libraries that are never used by GZWeb
+
+_KEEP_TAGS = {
+    f"{COLLADA_NS}library_animations",
+    f"{COLLADA_NS}library_animation_clips",
+}  # Libraries with entries that are used without being referenced
+_INDEX_NAME = f"{GZWEB_FOLDER}/index.json"
+_MIN_FILES_PER_PROCESS = 4
+
+
+@dataclass
+class CompactionStats:
+    compacted_files: int = 0
+    cached_files: int = 0
+    original_bytes: int = 0
+    compacted_bytes: int = 0
+
+
+class GZWebCompactor:
+    """
+    Creates smaller variants of the GZWeb assets in a copy plan, so the browser can load them faster. Textures are
+    downscaled to the maximum texture size and COLLADA files are minified without unused libraries. The Gazebo copies
+    of the same files are not changed.
+
+    Variants are stored in the cache folder by the content hash of the original file and the settings, so assets that
+    did not change are never processed again. Textures are only downscaled when Pillow is installed.
+    """
+
+    def __init__(self, max_texture_size: int = DEFAULT_MAX_TEXTURE_SIZE, jobs: int | None = None) -> None:
+        self.max_texture_size = max_texture_size
+        self.jobs = jobs or cpu_count() or 1
+        self.stats = CompactionStats()
+
+    def compact(self, plan: CopyPlan) -> CompactionStats:
+        extensions = MESH_EXTENSIONS + (TEXTURE_EXTENSIONS if _import_pillow() is not None else ())
+        assets = {
+            dst: src
+            for dst, src in plan.files.items()
+            if dst.parts[0] == GZWEB_FOLDER and src.suffix.lower() in extensions
+        }
+
+        index = read_json(_INDEX_NAME)
+        if not isinstance(index, dict) or index.get("version") != COMPACTOR_VERSION:
+            index = {"version": COMPACTOR_VERSION, "hashes": {}, "variants": {}}
+
+        keys = {src: self._get_key(src, index["hashes"]) for src in set(assets.values())}
+        missing = [src for src, key in keys.items() if key not in index["variants"]]
+
+        for src, variant in zip(missing, self._create_variants(missing)):
+            index["variants"][keys[src]] = variant
+
+        self.stats.cached_files = len(keys) - len(missing)
+
+        for dst, src in assets.items():
+            variant = index["variants"].get(keys[src])
+            if variant is None:
+                continue
+
+            # Variants that were removed from the cache folder are created again on the next run
+            variant_file = CACHE_FOLDER / GZWEB_FOLDER / variant
+            if not variant_file.is_file():
+                index["variants"].pop(keys[src])
+                continue
+
+            plan.files[dst] = variant_file
+            self.stats.compacted_files += 1
+            self.stats.original_bytes += src.stat().st_size
+            self.stats.compacted_bytes += variant_file.stat().st_size
+
+        write_json(_INDEX_NAME, index)
+        return self.stats
+
+    def _get_key(self, src: Path, hashes: dict[str, list]) -> str:
+        src_stat = src.stat()
+        size, mtime, file_hash = hashes.get(str(src), (None, None, None))
+
+        if size != src_stat.st_size or mtime != src_stat.st_mtime_ns:
+            file_hash = hash_file(src)
+            hashes[str(src)] = [src_stat.st_size, src_stat.st_mtime_ns, file_hash]
+
+        settings = f"{COMPACTOR_VERSION}\0{self.max_texture_size}\0{src.suffix.lower()}"
+        return sha256(f"{settings}\0{file_hash}".encode("utf-8")).hexdigest()
+
+    def _create_variants(self, files: list[Path]) -> list[str | None]:
+        max_texture_sizes = [self.max_texture_size] * len(files)
+
+        # Starting processes is only worth it when there are enough files to process
+        if self.jobs == 1 or len(files) < 2 * _MIN_FILES_PER_PROCESS:
+            return list(map(create_variant, files, max_texture_sizes))
+
+        jobs = min(self.jobs, len(files) // _MIN_FILES_PER_PROCESS)
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            return list(executor.map(create_variant, files, max_texture_sizes))
+
+
+def create_variant(file: Path, max_texture_size: int) -> str | None:
+    """
+    Writes the compacted variant of a file to the cache folder. Returns the name of the variant, or None if the
+    original file cannot be made smaller.
+    """
+    try:
+        if file.suffix.lower() in MESH_EXTENSIONS:
+            data = compact_collada(file)
+        else:
+            data = downscale_texture(file, max_texture_size)
+
+    except (OSError, ElementTree.ParseError):
+        return None
+
+    if data is None or len(data) >= file.stat().st_size:
+        return None
+
+    variant = f"{sha256(data).hexdigest()}{file.suffix.lower()}"
+    write_bytes(f"{GZWEB_FOLDER}/{variant}", data)
+    return variant
+
+
+def compact_collada(file: Path) -> bytes:
+    """
+    Removes libraries that GZWeb never uses, library entries that are not referenced and all formatting whitespace
+    from a COLLADA file.
+    """
+    ElementTree.register_namespace("", COLLADA_NS.strip("{}"))
+    root = ElementTree.parse(file).getroot()
+
+    for library in [e for e in root if e.tag in {f"{COLLADA_NS}{t}" for t in UNUSED_LIBRARY_TAGS}]:
+        root.remove(library)
+
+    # Removing an entry can make other entries unused, so repeat until nothing changes
+    removed = True
+    while removed:
+        removed = False
+        referenced_ids = _get_referenced_ids(root)
+
+        for library in [e for e in root if e.tag.startswith(f"{COLLADA_NS}library_") and e.tag not in _KEEP_TAGS]:
+            for entry in [e for e in library if e.get("id") is not None and e.get("id") not in referenced_ids]:
+                library.remove(entry)
+                removed = True
+
+            if len(library) == 0:
+                root.remove(library)
+
+    for element in root.iter():
+        element.tail = None
+        if element.text is not None:
+            element.text = " ".join(element.text.split()) or None
+
+    return ElementTree.tostring(root, encoding="utf-8", xml_declaration=True)
+
+
+def _get_referenced_ids(root: ElementTree.Element) -> set[str]:
+    referenced_ids = set()
+
+    for element in root.iter():
+        for value in element.attrib.values():
+            if value.startswith("#"):
+                referenced_ids.add(value[1:])
+
+        # Images are referenced by their id in surfaces and textures of COLLADA 1.4
+        if element.tag == f"{COLLADA_NS}init_from" and element.text:
+            referenced_ids.add(element.text.strip())
+        if element.tag == f"{COLLADA_NS}texture":
+            referenced_ids.add(element.get("texture", ""))
+
+    return referenced_ids
+
+
+def downscale_texture(file: Path, max_texture_size: int) -> bytes | None:
+    Image = _import_pillow()
+
+    with Image.open(file) as image:
+        if max(image.size) <= max_texture_size:
+            return None
+
+        image_format = image.format
+        image.thumbnail((max_texture_size, max_texture_size), Image.LANCZOS)
+
+        data = BytesIO()
+        image.save(data, format=image_format, optimize=True)
+        return data.getvalue()
+
+
+def _import_pillow() -> ModuleType | None:
+    # Pillow is optional and takes a long time to import, so it is only imported when textures are compacted
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    return Image
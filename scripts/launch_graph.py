@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from dataclasses import dataclass
+from hashlib import sha256
+from os import environ
+from os.path import normpath
+from pathlib import Path
+from re import Match, compile, search
+from threading import Lock
+from xml.etree import ElementTree
+
+from disk_cache import read_json, write_json
+from package_resolver import ResourceNotFound, package_resolver
+from profiler import profiler
+
+CACHE_VERSION = 2
+ENTRY_LAUNCH_FILE = "launch/simulation.launch"  # Launch file of virtual_maize_field that starts the simulation
+ROBOT_DESCRIPTION_EXTENSIONS = (".xacro", ".urdf")
+SUBSTITUTION_REGEX = compile(r"\$\((\w+)(?:\s+([^()]*?))?\s*\)")
+MAX_SUBSTITUTION_DEPTH = 8  # Number of nested substitutions that are resolved, like '$(find $(arg package))'
+UNRESOLVED_FIND_REGEX = compile(r"\$\(find\s+(\S+?)\)\S*\.(?:xacro|urdf)\b")
+
+_FALSE_VALUES = ("0", "false")
+
+
+@dataclass(frozen=True)
+class LaunchReference:
+    package: str
+    file: Path  # Xacro or URDF file
+    launch_file: Path  # Launch file that uses the file
+
+
+class _Unresolved(Exception):
+    pass
+
+
+class _Traversal:
+    """
+    State of a single traversal of the launch files, which records everything the result depends on.
+    """
+
+    def __init__(self) -> None:
+        self.stamps: dict[str, list[int]] = {}
+        self.environment: dict[str, str | None] = {}
+        self.packages: dict[str, str | None] = {}
+        self.references: dict[Path, LaunchReference] = {}
+
+    def visit(self, entry_file: Path) -> None:
+        pending = [(entry_file, {})]
+        visited = set()
+
+        while pending:
+            launch_file, args = pending.pop()
+            key = (launch_file, tuple(sorted(args.items())))
+
+            if key in visited:
+                continue
+            visited.add(key)
+
+            try:
+                file_stat = launch_file.stat()
+                self.stamps[str(launch_file)] = [file_stat.st_size, file_stat.st_mtime_ns]
+
+                with profiler.span("launch", str(launch_file)):
+                    root = ElementTree.parse(launch_file).getroot()
+
+            except (OSError, ElementTree.ParseError):
+                self.stamps[str(launch_file)] = []
+                continue
+
+            # Included files are visited in the order they are included
+            includes = self._visit_element(root, launch_file, dict(args), args)
+            pending.extend(reversed(includes))
+
+    def _visit_element(
+        self, element: ElementTree.Element, launch_file: Path, scope: dict[str, str], passed_args: dict[str, str]
+    ) -> list[tuple[Path, dict[str, str]]]:
+        includes = []
+
+        for child in element:
+            if not self._is_enabled(child, launch_file, scope):
+                continue
+
+            if child.tag == "arg":
+                self._set_arg(child, launch_file, scope, passed_args)
+
+            elif child.tag == "include":
+                include = self._get_include(child, launch_file, scope)
+                if include is not None:
+                    includes.append(include)
+
+            else:
+                self._add_references(child, launch_file, scope)
+                includes.extend(self._visit_element(child, launch_file, scope, passed_args))
+
+        return includes
+
+    def _is_enabled(self, element: ElementTree.Element, launch_file: Path, scope: dict[str, str]) -> bool:
+        # Conditions that cannot be resolved are considered true, so no file is missed
+        try:
+            if "if" in element.attrib:
+                return self.substitute(element.attrib["if"], launch_file, scope).strip().lower() not in _FALSE_VALUES
+            if "unless" in element.attrib:
+                return self.substitute(element.attrib["unless"], launch_file, scope).strip().lower() in _FALSE_VALUES
+        except _Unresolved:
+            pass
+
+        return True
+
+    def _set_arg(
+        self, element: ElementTree.Element, launch_file: Path, scope: dict[str, str], passed_args: dict[str, str]
+    ) -> None:
+        name = element.get("name")
+        scope.pop(name, None)
+
+        try:
+            if "value" in element.attrib:
+                scope[name] = self.substitute(element.attrib["value"], launch_file, scope)
+            elif name in passed_args:
+                scope[name] = passed_args[name]
+            elif "default" in element.attrib:
+                scope[name] = self.substitute(element.attrib["default"], launch_file, scope)
+        except _Unresolved:
+            pass
+
+    def _get_include(
+        self, element: ElementTree.Element, launch_file: Path, scope: dict[str, str]
+    ) -> tuple[Path, dict[str, str]] | None:
+        try:
+            included_file = Path(self.substitute(element.get("file", ""), launch_file, scope))
+        except _Unresolved:
+            return None
+
+        args = dict(scope) if element.get("pass_all_args", "").lower() == "true" else {}
+
+        for arg in element.iter("arg"):
+            if self._is_enabled(arg, launch_file, scope):
+                # Arguments of an include are set by their value or else by their default
+                value = arg.get("value", arg.get("default"))
+                if value is None:
+                    continue
+
+                try:
+                    args[arg.get("name")] = self.substitute(value, launch_file, scope)
+                except _Unresolved:
+                    pass
+
+        return included_file, args
+
+    def _add_references(self, element: ElementTree.Element, launch_file: Path, scope: dict[str, str]) -> None:
+        for value in [*element.attrib.values(), element.text or ""]:
+            if "$(" not in value and not any(extension in value for extension in ROBOT_DESCRIPTION_EXTENSIONS):
+                continue
+
+            # Commands can contain other files that cannot be resolved, like '$(find xacro)/xacro'
+            value = self.substitute(value, launch_file, scope, strict=False)
+
+            # Robot descriptions in packages that cannot be found are an error of the workspace
+            missing_package = search(UNRESOLVED_FIND_REGEX, value)
+            if missing_package is not None:
+                print(f"Could not find resource '{missing_package.group(1)}'!")
+                raise ResourceNotFound(missing_package.group(1), ros_paths=package_resolver.get_ros_paths())
+
+            for word in value.split():
+                file = Path(normpath(word.strip("'\"")))
+
+                if file.is_absolute() and file.suffix in ROBOT_DESCRIPTION_EXTENSIONS and file not in self.references:
+                    self.references[file] = LaunchReference(self._get_package(file), file, launch_file)
+
+    def _get_package(self, file: Path) -> str:
+        package_folders = [(folder, name) for name, folder in self.packages.items() if folder is not None]
+        package = _find_package(file, package_folders)
+
+        # Files that are found through $(dirname) can be in a package that was never found by name
+        if package is None:
+            package = _find_package(file, [(package_resolver.get_path(name), name) for name in package_resolver.list()])
+
+            if package is not None:
+                self.packages[package] = package_resolver.get_path(package)
+
+        return package or ""
+
+    def substitute(self, value: str, launch_file: Path, scope: dict[str, str], strict: bool = True) -> str:
+        """
+        Replaces the substitution arguments in a value. Nested substitutions are replaced from the inside out. Raises
+        _Unresolved if a substitution cannot be resolved, or keeps that substitution when strict is not set.
+        """
+
+        def replace(match: Match) -> str:
+            command, argument = match.group(1), (match.group(2) or "").strip()
+
+            if command == "find":
+                try:
+                    self.packages[argument] = package_resolver.get_path(argument)
+                except ResourceNotFound:
+                    self.packages[argument] = None
+                    return _unresolved(match, strict)
+
+                return self.packages[argument]
+
+            if command == "arg" and argument in scope:
+                return scope[argument]
+
+            if command in ("env", "optenv"):
+                variable, _, default = argument.partition(" ")
+                self.environment[variable] = environ.get(variable)
+
+                if self.environment[variable] is not None:
+                    return self.environment[variable]
+                if command == "optenv":
+                    return default
+
+            if command == "dirname":
+                return str(launch_file.parent)
+
+            return _unresolved(match, strict)
+
+        for _ in range(MAX_SUBSTITUTION_DEPTH):
+            substituted_value = SUBSTITUTION_REGEX.sub(replace, value)
+            if substituted_value == value:
+                break
+
+            value = substituted_value
+
+        return value
+
+
+def _find_package(file: Path, package_folders: list[tuple[str, str]]) -> str | None:
+    # The package of a file is the package with the longest folder that contains the file
+    for folder, name in sorted(package_folders, key=lambda p: len(p[0]), reverse=True):
+        if Path(folder) in file.parents:
+            return name
+
+    return None
+
+
+def _unresolved(match: Match, strict: bool) -> str:
+    if strict:
+        raise _Unresolved(match.group(0))
+
+    return match.group(0)
+
+
+class LaunchGraph:
+    """
+    Finds the xacro and URDF files that are used by launch files. Starting from the entry launch files, all included
+    launch files are followed with the values of their arguments and each launch file is visited once for every set
+    of arguments. Launch files that are not reachable from the entry launch files are never read.
+
+    The result is saved on disk, together with the size and modification time of every visited launch file, the
+    environment variables and the folders of the packages that were used. As long as these did not change, the saved
+    result is used.
+    """
+
+    def __init__(self, use_cache: bool = True) -> None:
+        self.use_cache = use_cache
+        self.hits = 0
+        self.misses = 0
+
+        self._results: dict[str, dict] = {}
+        self._lock = Lock()
+
+    def get_references(self, entry_files: Iterable[Path]) -> list[LaunchReference]:
+        entry_files = [f.resolve() for f in entry_files]
+        key = sha256("\0".join(map(str, entry_files)).encode("utf-8", "surrogateescape")).hexdigest()
+        cache_name = f"launch/{key}.json"
+
+        with self._lock:
+            result = self._results.get(key)
+            if result is None and self.use_cache:
+                result = read_json(cache_name)
+
+            if isinstance(result, dict) and result.get("version") == CACHE_VERSION and self._is_valid(result):
+                self.hits += 1
+                self._results[key] = result
+                return [LaunchReference(p, Path(f), Path(l)) for p, f, l in result["references"]]
+
+            self.misses += 1
+            traversal = _Traversal()
+            for entry_file in entry_files:
+                traversal.visit(entry_file)
+
+            result = {
+                "version": CACHE_VERSION,
+                "stamps": traversal.stamps,
+                "environment": traversal.environment,
+                "packages": traversal.packages,
+                "references": [[r.package, str(r.file), str(r.launch_file)] for r in traversal.references.values()],
+            }
+            self._results[key] = result
+
+            if self.use_cache:
+                write_json(cache_name, result)
+
+            return list(traversal.references.values())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+    @staticmethod
+    def _is_valid(result: dict) -> bool:
+        for variable, value in result["environment"].items():
+            if environ.get(variable) != value:
+                return False
+
+        for package, folder in result["packages"].items():
+            try:
+                if package_resolver.get_path(package) != folder:
+                    return False
+            except ResourceNotFound:
+                if folder is not None:
+                    return False
+
+        for file, stamp in result["stamps"].items():
+            try:
+                file_stat = Path(file).stat()
+            except OSError:
+                file_stat = None
+
+            if stamp != ([file_stat.st_size, file_stat.st_mtime_ns] if file_stat is not None else []):
+                return False
+
+        return True
+
+
+# Launch graph that is shared by all scripts
+launch_graph = LaunchGraph()
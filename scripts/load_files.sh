@@ -56,6 +56,17 @@ fi
 echo "Unzipping simulation files..."
 unzip -qq ${SIMULATION_FILES} -d ${TEAM_FILES_DIR}
 
+# Recreate files that are only stored once in a deduplicated archive
+for dir in "${TEAM_FILES_DIR}/simulation_files" "${TEAM_FILES_DIR}"; do
+  [ -f "${dir}/.links.json" ] || continue
+  python3 "${SCRIPT_DIR}/archive.py" --restore-links "${dir}"
+
+  if [ $? -ne 0 ]; then
+    echo "Failed to restore deduplicated files in ${dir}!"
+    exit 1
+  fi
+done
+
 # Put files folder higher if placed in simulation_files subfolder
 if [ -d "${TEAM_FILES_DIR}/simulation_files" ]; then
   pushd ${TEAM_FILES_DIR}
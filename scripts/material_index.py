@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import os
+from collections.abc import Iterable
+from dataclasses import dataclass
+from hashlib import sha256
+from pathlib import Path
+from re import compile
+
+from disk_cache import read_json, write_json
+from profiler import profiler
+
+CACHE_VERSION = 1
+MATERIAL_EXTENSION = ".material"
+TEXTURE_KEYWORDS = ("texture", "cubic_texture", "anim_texture")
+COMMENT_REGEX = compile(r"//[^\n]*")
+TOKEN_REGEX = compile(r"[{}:]|[^\s{}:]+")
+
+
+@dataclass(frozen=True)
+class Material:
+    name: str
+    script: str  # Path of the script, relative to the material folder
+    textures: tuple[str, ...]  # File names of the textures used by the material
+    parent: str | None = None  # Material of which this material inherits all properties
+
+
+class MaterialIndex:
+    """
+    Index of the Gazebo material scripts in a folder, which maps every material name to the script that defines it
+    and the textures it uses. The index is saved on disk, together with the modification times of the folders and
+    scripts, and is only created again when these change.
+    """
+
+    def __init__(self, folder: Path, use_cache: bool = True) -> None:
+        self.folder = folder
+        self.use_cache = use_cache
+        self.materials: dict[str, Material] = {}
+        self.textures: dict[str, list[str]] = {}  # Paths of the textures in the folder by file name
+
+        self._load()
+
+    def get_files(self, material_names: Iterable[str]) -> list[Path]:
+        """
+        Returns the scripts and textures that are needed for the given materials and the materials they inherit
+        from. Materials that are not defined in the folder are skipped.
+        """
+        files = set()
+        pending = list(material_names)
+        visited = set()
+
+        while pending:
+            material = self.materials.get(pending.pop())
+            if material is None or material.name in visited:
+                continue
+
+            visited.add(material.name)
+            files.add(material.script)
+
+            for texture in material.textures:
+                files.update(self.textures.get(Path(texture).name, ()))
+
+            if material.parent is not None:
+                pending.append(material.parent)
+
+        return [self.folder / f for f in sorted(files)]
+
+    def _load(self) -> None:
+        stamps, scripts = self._scan_folder()
+        cache_name = f"materials/{sha256(str(self.folder).encode('utf-8', 'surrogateescape')).hexdigest()}.json"
+        cache = read_json(cache_name) if self.use_cache else None
+
+        if isinstance(cache, dict) and cache.get("version") == CACHE_VERSION and cache.get("stamps") == stamps:
+            self.materials = {m[0]: Material(m[0], m[1], tuple(m[2]), m[3]) for m in cache["materials"]}
+            return
+
+        for script in scripts:
+            with profiler.span("material", script):
+                for material in parse_material_script(self.folder / script, script):
+                    # The first definition of a material is used, like Ogre does
+                    self.materials.setdefault(material.name, material)
+
+        if self.use_cache:
+            materials = [[m.name, m.script, list(m.textures), m.parent] for m in self.materials.values()]
+            write_json(cache_name, {"version": CACHE_VERSION, "stamps": stamps, "materials": materials})
+
+    def _scan_folder(self) -> tuple[dict[str, int], list[str]]:
+        # Adding or removing a file changes the modification time of its folder, changing a script changes its own
+        stamps = {}
+        scripts = []
+
+        for folder, folder_names, file_names in os.walk(self.folder):
+            folder_names.sort()
+            relative_folder = Path(folder).relative_to(self.folder)
+            stamps[relative_folder.as_posix()] = os.stat(folder).st_mtime_ns
+
+            for file_name in sorted(file_names):
+                relative_file = (relative_folder / file_name).as_posix()
+
+                if file_name.endswith(MATERIAL_EXTENSION):
+                    stamps[relative_file] = os.stat(os.path.join(folder, file_name)).st_mtime_ns
+                    scripts.append(relative_file)
+                else:
+                    self.textures.setdefault(file_name, []).append(relative_file)
+
+        return stamps, scripts
+
+
+def parse_material_script(file: Path, script: str) -> list[Material]:
+    """
+    Reads the materials that are defined at the top level of an Ogre material script, with the textures that are
+    used anywhere in their definition.
+    """
+    definitions: list[tuple[str, str | None, list[str]]] = []
+    tokens = TOKEN_REGEX.findall(COMMENT_REGEX.sub("", file.read_text(encoding="utf-8", errors="replace")))
+    depth = 0
+
+    for i, token in enumerate(tokens):
+        if token == "{":
+            depth += 1
+        elif token == "}":
+            depth = max(0, depth - 1)
+
+        # Materials are defined as 'material Name' or 'material Name : Parent'
+        elif depth == 0 and token == "material" and i + 1 < len(tokens):
+            parent = tokens[i + 3] if i + 3 < len(tokens) and tokens[i + 2] == ":" else None
+            definitions.append((tokens[i + 1], parent, []))
+
+        elif depth > 0 and token in TEXTURE_KEYWORDS and definitions and i + 1 < len(tokens):
+            definitions[-1][2].append(tokens[i + 1])
+
+    return [Material(name, script, tuple(textures), parent) for name, parent, textures in definitions]
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count, getpid
+from pathlib import Path
+from time import perf_counter_ns
+from xml.etree.ElementTree import iterparse
+
+from profiler import profiler
+
+COLLADA_NS = "{http://www.collada.org/2005/11/COLLADASchema}"
+TEXTURE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+TEXTURE_FOLDER = "../materials/textures"  # Textures should be referenced relative to the meshes folder of a model
+
+_INIT_FROM_TAG = f"{COLLADA_NS}init_from"
+_REF_TAG = f"{COLLADA_NS}ref"  # COLLADA 1.5 places the file of an image in init_from/ref
+_IMAGE_LIBRARY_TAGS = {
+    f"{COLLADA_NS}library_images",
+    f"{COLLADA_NS}library_effects",
+}  # Libraries that can contain images, which can be written in any order
+_LARGE_LIBRARY_TAGS = {
+    f"{COLLADA_NS}library_animations",
+    f"{COLLADA_NS}library_controllers",
+    f"{COLLADA_NS}library_geometries",
+    f"{COLLADA_NS}library_visual_scenes",
+}  # Libraries that make up most of a file, but never contain texture references
+_MIN_FILES_PER_PROCESS = 4
+
+
+def get_texture_references(mesh_file: Path) -> list[str]:
+    """
+    Returns the texture files referenced in a COLLADA file. The file is read as a stream and elements are removed
+    after reading them, so the memory usage does not depend on the file size. Reading stops at the first large library
+    after the image and effect libraries are read, because images are only declared in these libraries.
+    """
+    textures = []
+    image_libraries = set()
+    parents = []
+
+    for event, element in iterparse(str(mesh_file), events=("start", "end")):
+        if event == "start":
+            if element.tag in _LARGE_LIBRARY_TAGS and image_libraries == _IMAGE_LIBRARY_TAGS:
+                break
+
+            parents.append(element)
+            continue
+
+        parents.pop()
+        if parents:
+            parents[-1].remove(element)
+
+        is_reference = element.tag == _INIT_FROM_TAG or (
+            element.tag == _REF_TAG and parents and parents[-1].tag == _INIT_FROM_TAG
+        )
+        if is_reference and element.text and element.text.strip().endswith(TEXTURE_EXTENSIONS):
+            textures.append(element.text.strip())
+
+        elif element.tag in _IMAGE_LIBRARY_TAGS:
+            image_libraries.add(element.tag)
+
+    return textures
+
+
+def get_invalid_texture_references(mesh_file: Path) -> list[str]:
+    return [t for t in get_texture_references(mesh_file) if TEXTURE_FOLDER not in t]
+
+
+def _scan_mesh_file(mesh_file: Path) -> tuple[list[str], int, int, int]:
+    # Files can be scanned by other processes, so the time is measured here and recorded by the main process
+    start = perf_counter_ns()
+    invalid_textures = get_invalid_texture_references(mesh_file)
+    return invalid_textures, start, perf_counter_ns(), getpid()
+
+
+def _collect_results(
+    mesh_files: list[Path], results: Iterable[tuple[list[str], int, int, int]]
+) -> dict[Path, list[str]]:
+    invalid_textures = {}
+
+    for mesh_file, (textures, start, end, pid) in zip(mesh_files, results):
+        if profiler.enabled:
+            profiler.add("mesh", str(mesh_file), start, end, mesh_file.stat().st_size, pid)
+
+        if textures:
+            invalid_textures[mesh_file] = textures
+
+    return invalid_textures
+
+
+def find_invalid_texture_references(mesh_files: Iterable[Path], jobs: int | None = None) -> dict[Path, list[str]]:
+    mesh_files = list(dict.fromkeys(mesh_files))
+    jobs = jobs or cpu_count() or 1
+
+    # Starting processes is only worth it when there are enough files to scan
+    if jobs == 1 or len(mesh_files) < 2 * _MIN_FILES_PER_PROCESS:
+        return _collect_results(mesh_files, map(_scan_mesh_file, mesh_files))
+
+    jobs = min(jobs, len(mesh_files) // _MIN_FILES_PER_PROCESS)
+    chunk_size = max(1, len(mesh_files) // (jobs * 4))
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return _collect_results(mesh_files, executor.map(_scan_mesh_file, mesh_files, chunksize=chunk_size))
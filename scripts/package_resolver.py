@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import os
+from hashlib import sha256
+from pathlib import Path
+from threading import RLock
+from xml.etree import ElementTree
+
+from disk_cache import read_json, write_json
+from profiler import profiler
+
+CACHE_FOLDER_NAME = "ros_packages"
+CACHE_VERSION = 2
+
+
+class ResourceNotFound(Exception):
+    """
+    Raised when a ROS package cannot be found, with the same message as the exception of rospkg.
+    """
+
+    def __init__(self, msg: str, ros_paths: list[str] | None = None) -> None:
+        super().__init__(msg)
+        self.ros_paths = ros_paths
+
+    def __str__(self) -> str:
+        msg = str(self.args[0])
+
+        for i, ros_path in enumerate(self.ros_paths or []):
+            msg += f"\nROS path [{i}]={ros_path}"
+
+        return msg
+
+
+class PackageResolver:
+    """
+    Maps ROS package names to their folder, like rospkg.RosPack. The result of crawling each folder of the ROS package
+    path is saved on disk, together with the modification times of the crawled directories and package manifests. As
+    long as these modification times did not change, the saved result is used without crawling. Different ROS package
+    paths that share folders, like the workspaces of multiple teams on top of the same ROS installation, share the
+    saved results of these folders.
+    """
+
+    def __init__(self, use_cache: bool = True) -> None:
+        self.use_cache = use_cache
+        self.crawl_count = 0  # Number of crawled folders of the ROS package path
+
+        self._ros_paths: list[str] | None = None
+        self._packages: dict[str, str] = {}
+        self._crawled = False
+        self._lock = RLock()
+
+    def get_path(self, package_name: str) -> str:
+        with profiler.span("resolver", package_name), self._lock:
+            packages = self._load()
+
+            # Packages that are added after the cache was saved do not always change the stamps, so crawl once more
+            if package_name not in packages and not self._crawled:
+                packages = self.crawl()
+
+        try:
+            return packages[package_name]
+        except KeyError:
+            raise ResourceNotFound(package_name, ros_paths=self._ros_paths) from None
+
+    def list(self) -> list[str]:
+        with self._lock:
+            return sorted(self._load())
+
+    def crawl(self) -> dict[str, str]:
+        with profiler.span("resolver", "crawl"), self._lock:
+            ros_paths = self.get_ros_paths()
+            packages: dict[str, str] = {}
+
+            # Packages in earlier folders of the ROS package path take precedence
+            for ros_path in ros_paths:
+                for package_name, folder in self._crawl_path(ros_path).items():
+                    packages.setdefault(package_name, folder)
+
+            self._ros_paths = ros_paths
+            self._packages = packages
+            self._crawled = True
+
+            return packages
+
+    def clear(self) -> None:
+        """
+        Forgets the packages found in this run, the saved result on disk is kept.
+        """
+        with self._lock:
+            self._ros_paths = None
+            self._packages = {}
+            self._crawled = False
+
+    def _load(self) -> dict[str, str]:
+        ros_paths = self.get_ros_paths()
+
+        if self._ros_paths == ros_paths:
+            return self._packages
+
+        self._crawled = False
+        packages: dict[str, str] = {}
+
+        for ros_path in ros_paths:
+            cache = read_json(self._get_cache_name(ros_path)) if self.use_cache else None
+            path_packages = cache["packages"] if self._is_valid_cache(cache, ros_path) else self._crawl_path(ros_path)
+
+            for package_name, folder in path_packages.items():
+                packages.setdefault(package_name, folder)
+
+        self._ros_paths = ros_paths
+        self._packages = packages
+        return packages
+
+    def _crawl_path(self, ros_path: str) -> dict[str, str]:
+        packages: dict[str, str] = {}
+        stamps: dict[str, int] = {}
+
+        self._crawl_folder(ros_path, packages, stamps)
+        self.crawl_count += 1
+
+        if self.use_cache:
+            write_json(
+                self._get_cache_name(ros_path),
+                {"version": CACHE_VERSION, "ros_path": ros_path, "stamps": stamps, "packages": packages},
+            )
+
+        return packages
+
+    @staticmethod
+    def _get_cache_name(ros_path: str) -> str:
+        return f"{CACHE_FOLDER_NAME}/{sha256(ros_path.encode('utf-8', 'surrogateescape')).hexdigest()}.json"
+
+    @staticmethod
+    def _is_valid_cache(cache: dict | None, ros_path: str) -> bool:
+        if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION or cache.get("ros_path") != ros_path:
+            return False
+
+        for path, mtime in cache["stamps"].items():
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+
+        return True
+
+    @staticmethod
+    def _crawl_folder(ros_path: str, packages: dict[str, str], stamps: dict[str, int]) -> None:
+        # Follows the same rules as rospkg: stop at package folders, skip hidden folders and folders with CATKIN_IGNORE
+        for folder, sub_folders, files in os.walk(ros_path, followlinks=True):
+            if "CATKIN_IGNORE" in files:
+                sub_folders.clear()
+                continue
+
+            if "package.xml" in files:
+                manifest = os.path.join(folder, "package.xml")
+                stamps[manifest] = os.stat(manifest).st_mtime_ns
+
+                try:
+                    package_name = ElementTree.parse(manifest).getroot().findtext("name", "").strip()
+                except ElementTree.ParseError:
+                    package_name = ""
+
+                if package_name and package_name not in packages:
+                    packages[package_name] = folder
+
+                sub_folders.clear()
+                continue
+
+            stamps[folder] = os.stat(folder).st_mtime_ns
+
+            if "rospack_nosubdirs" in files:
+                sub_folders.clear()
+                continue
+
+            sub_folders[:] = [f for f in sub_folders if not f.startswith(".")]
+
+    @staticmethod
+    def get_ros_paths() -> list[str]:
+        ros_paths = []
+
+        for variable in ("ROS_PACKAGE_PATH", "ROS_ROOT"):
+            for ros_path in os.environ.get(variable, "").split(os.pathsep):
+                ros_path = str(Path(ros_path).expanduser()) if ros_path else ""
+
+                if ros_path and ros_path not in ros_paths:
+                    ros_paths.append(ros_path)
+
+        return ros_paths
+
+
+# Resolver that is shared by all scripts, so the ROS package path is crawled at most once per run
+package_resolver = PackageResolver()
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from threading import Lock, get_ident
+from time import perf_counter_ns
+
+DEFAULT_REPORT_LIMIT = 20  # Number of hot spots that are printed
+COPY_CATEGORY = "copy"
+
+
+@dataclass
+class Span:
+    category: str
+    name: str
+    start: int  # Nanoseconds of time.perf_counter_ns, which is the same clock in all processes of a machine
+    end: int
+    thread: int
+    size: int = 0  # Number of bytes that were processed
+
+    @property
+    def duration(self) -> int:
+        return self.end - self.start
+
+
+@dataclass
+class HotSpot:
+    category: str
+    name: str
+    count: int = 0
+    total_time: int = 0
+    max_time: int = 0
+    size: int = 0
+
+
+class _ActiveSpan:
+    def __init__(self, profiler: Profiler, category: str, name: str, size: int) -> None:
+        self.profiler = profiler
+        self.category = category
+        self.name = name
+        self.size = size
+
+    def __enter__(self) -> _ActiveSpan:
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.profiler.add(self.category, self.name, self.start, perf_counter_ns(), self.size)
+
+
+class _DisabledSpan:
+    def __enter__(self) -> _DisabledSpan:
+        return self
+
+    def __exit__(self, *_) -> None:
+        pass
+
+
+_DISABLED_SPAN = _DisabledSpan()
+
+
+class Profiler:
+    """
+    Records how long the stages of the scripts take. Code is measured by a span with a category, like 'check' or
+    'xacro', and a name, like the file that is processed. Spans are only recorded when the profiler is enabled,
+    otherwise measuring costs almost nothing. Spans can be recorded by multiple threads at the same time.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.spans: list[Span] = []
+
+        self._lock = Lock()
+
+    def span(self, category: str, name: str, size: int = 0) -> _ActiveSpan | _DisabledSpan:
+        if not self.enabled:
+            return _DISABLED_SPAN
+
+        return _ActiveSpan(self, category, name, size)
+
+    def add(self, category: str, name: str, start: int, end: int, size: int = 0, thread: int | None = None) -> None:
+        """
+        Records a span that was measured before, for example by another process.
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self.spans.append(Span(category, name, start, end, thread if thread is not None else get_ident(), size))
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans.clear()
+
+    def get_hot_spots(self) -> list[HotSpot]:
+        hot_spots: dict[tuple[str, str], HotSpot] = {}
+
+        with self._lock:
+            spans = list(self.spans)
+
+        for span in spans:
+            hot_spot = hot_spots.setdefault((span.category, span.name), HotSpot(span.category, span.name))
+            hot_spot.count += 1
+            hot_spot.total_time += span.duration
+            hot_spot.max_time = max(hot_spot.max_time, span.duration)
+            hot_spot.size += span.size
+
+        return sorted(hot_spots.values(), key=lambda h: h.total_time, reverse=True)
+
+    def get_copied_folders(self) -> list[HotSpot]:
+        folders: dict[str, HotSpot] = {}
+
+        for hot_spot in self.get_hot_spots():
+            if hot_spot.category != COPY_CATEGORY:
+                continue
+
+            folder = hot_spot.name.split("/")[0]
+            folder_hot_spot = folders.setdefault(folder, HotSpot(COPY_CATEGORY, folder))
+            folder_hot_spot.count += hot_spot.count
+            folder_hot_spot.total_time += hot_spot.total_time
+            folder_hot_spot.max_time = max(folder_hot_spot.max_time, hot_spot.max_time)
+            folder_hot_spot.size += hot_spot.size
+
+        return sorted(folders.values(), key=lambda h: h.size, reverse=True)
+
+    def print_report(self, limit: int = DEFAULT_REPORT_LIMIT) -> None:
+        print(f"\nProfile (top {limit} of all measured code, sorted by total time):")
+        print(f"{'Category' : <10}{'Name' : <60}{'Count' : >7}{'Total' : >11}{'Max' : >11}{'Size' : >11}")
+
+        for hot_spot in self.get_hot_spots()[:limit]:
+            name = hot_spot.name if len(hot_spot.name) <= 58 else f"...{hot_spot.name[-55:]}"
+            print(
+                f"{hot_spot.category : <10}{name : <60}{hot_spot.count : >7}{hot_spot.total_time / 1e6 : >9.1f}ms"
+                f"{hot_spot.max_time / 1e6 : >9.1f}ms{hot_spot.size / 1e6 : >9.1f}MB"
+            )
+
+        copied_folders = self.get_copied_folders()
+        if copied_folders:
+            print("\nCopied per folder (copy time summed over all threads):")
+            print(f"{'Folder' : <30}{'Files' : >7}{'Size' : >11}{'Throughput' : >14}")
+
+            for folder in copied_folders:
+                throughput = folder.size / (folder.total_time / 1e9) if folder.total_time > 0 else 0.0
+                print(
+                    f"{folder.name : <30}{folder.count : >7}{folder.size / 1e6 : >9.1f}MB{throughput / 1e6 : >9.1f}MB/s"
+                )
+
+    def write_json(self, file: Path) -> None:
+        with open(file, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "hot_spots": [asdict(h) for h in self.get_hot_spots()],
+                    "copied_folders": [asdict(h) for h in self.get_copied_folders()],
+                },
+                f,
+                indent=2,
+            )
+
+    def write_chrome_trace(self, file: Path) -> None:
+        """
+        Writes all spans in the Chrome trace event format, which can be opened in chrome://tracing or Perfetto.
+        """
+        with self._lock:
+            spans = list(self.spans)
+
+        start = min((s.start for s in spans), default=0)
+        events = [
+            {
+                "name": s.name,
+                "cat": s.category,
+                "ph": "X",
+                "ts": (s.start - start) / 1000,
+                "dur": s.duration / 1000,
+                "pid": os.getpid(),
+                "tid": s.thread,
+                "args": {"size": s.size} if s.size else {},
+            }
+            for s in spans
+        ]
+
+        with open(file, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+# Profiler that is shared by all scripts
+profiler = Profiler()
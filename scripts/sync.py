@@ -0,0 +1,492 @@
+from __future__ import annotations
+
+import ctypes
+import json
+import os
+import shutil
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from hashlib import sha256
+from pathlib import Path, PurePosixPath
+from threading import Lock, get_ident
+from time import perf_counter
+
+from copy_backend import CopyBackend
+from profiler import COPY_CATEGORY, profiler
+
+MANIFEST_NAME = ".manifest.json"
+MANIFEST_VERSION = 2
+BLOB_FOLDER_NAME = ".blobs"
+DEFAULT_COPY_JOBS = 8  # Copying is limited by I/O, so use more threads than there are cores
+
+_BUFFER_SIZE = 1024 * 1024
+_AT_FDCWD = -100
+_RENAME_EXCHANGE = 2
+
+
+class CopyPlan:
+    """
+    Describes the content of the simulation files folder. Maps destination paths, relative to the target folder, to
+    the source file that should be copied there.
+    """
+
+    def __init__(self) -> None:
+        self.files: dict[PurePosixPath, Path] = {}
+        self.folders: set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def add_file(self, src: Path, dst: PurePosixPath | str) -> None:
+        dst = PurePosixPath(dst)
+        self.folders.add(dst.parts[0])
+        self.files[dst] = src
+
+    def add_tree(
+        self,
+        src: Path,
+        dst: PurePosixPath | str,
+        extensions: tuple[str, ...] | None = None,
+        ignore_patterns: tuple[str, ...] = (),
+    ) -> None:
+        """
+        Adds all files in the src folder. Files and folders that match one of the ignore patterns are skipped without
+        visiting them and, if extensions are given, only files with one of these (lowercase) extensions are added.
+        """
+        dst = PurePosixPath(dst)
+        self.folders.add(dst.parts[0])
+
+        visited_folders = set()
+        folders = [(str(src), dst)]
+
+        while folders:
+            folder, dst_folder = folders.pop()
+
+            try:
+                folder_stat = os.stat(folder)
+                with os.scandir(folder) as entries:
+                    entries = list(entries)
+            except OSError:
+                continue
+
+            # Prevent infinite loops caused by symlinked directories
+            if (folder_stat.st_dev, folder_stat.st_ino) in visited_folders:
+                continue
+            visited_folders.add((folder_stat.st_dev, folder_stat.st_ino))
+
+            for entry in entries:
+                if any(fnmatch(entry.name, pattern) for pattern in ignore_patterns):
+                    continue
+
+                try:
+                    if entry.is_dir():
+                        folders.append((entry.path, dst_folder / entry.name))
+                        continue
+
+                    if not entry.is_file():
+                        continue
+
+                except OSError:
+                    continue
+
+                if extensions is None or os.path.splitext(entry.name)[1].lower() in extensions:
+                    self.files[dst_folder / entry.name] = Path(entry.path)
+
+    def get_files(self, folder: str) -> dict[PurePosixPath, Path]:
+        return {dst: src for dst, src in self.files.items() if dst.parts[0] == folder}
+
+
+@dataclass
+class SyncStats:
+    copied_files: int = 0
+    copied_bytes: int = 0
+    copy_seconds: float = 0.0
+    unchanged_files: int = 0
+    removed_files: int = 0
+
+    @property
+    def throughput(self) -> float:
+        return self.copied_bytes / self.copy_seconds if self.copy_seconds > 0 else 0.0
+
+
+@dataclass
+class FolderChanges:
+    folder: str
+    exists: bool
+    unchanged_files: list[PurePosixPath] = field(default_factory=list)
+    changed_files: list[PurePosixPath] = field(default_factory=list)
+    stale_files: set[PurePosixPath] = field(default_factory=set)
+
+    @property
+    def needs_update(self) -> bool:
+        return len(self.changed_files) > 0 or len(self.stale_files) > 0 or not self.exists
+
+
+def sync(
+    plan: CopyPlan,
+    target: Path,
+    backend: CopyBackend | None = None,
+    jobs: int = DEFAULT_COPY_JOBS,
+    deduplicate: bool = False,
+    blob_folder: Path | None = None,
+) -> SyncStats:
+    """
+    Makes the target folder equal to the copy plan. Only new and changed files are copied and only files that are not
+    in the plan are removed. Every top level folder that changes is built in a staging folder, in which the unchanged
+    files are hard linked, and is swapped with the current folder at once. The manifest keeps the size, modification
+    time and content hash of every copied file.
+
+    Containers that bind mount a top level folder keep using the folder they started with, so the replaced folder is
+    kept as .<folder>.old until the folder is replaced again. Containers have to be restarted to use the new files.
+
+    The changed files are copied by a pool of jobs threads. When deduplicate is set, every unique file content is
+    stored once in a content addressed blob folder and all files in the target folder are hard links to these blobs.
+    The blob folder is placed in the target folder, unless another blob folder is given, which can be shared by
+    multiple target folders on the same file system. Unused blobs in a shared blob folder are only removed by
+    remove_unused_blobs.
+    """
+    return SyncSession(target, backend, jobs, deduplicate, blob_folder).commit(plan)
+
+
+class SyncSession:
+    """
+    Sync of which the files can be staged before the final copy plan is known, so copying can start while the plan
+    is still being made. Staged files are compared with the target folder and changed files are copied to the
+    staging folders in the background. Commit stages the remaining files of the plan, forgets the staged files that
+    are not part of the plan and swaps the changed folders only after all files are copied. Discard removes the
+    staging folders and leaves the target folder as it is.
+    """
+
+    def __init__(
+        self,
+        target: Path,
+        backend: CopyBackend | None = None,
+        jobs: int = DEFAULT_COPY_JOBS,
+        deduplicate: bool = False,
+        blob_folder: Path | None = None,
+    ) -> None:
+        self.target = target
+        self.backend = backend if backend is not None else CopyBackend()
+        self.deduplicate = deduplicate
+        self.target.mkdir(parents=True, exist_ok=True)
+
+        manifest = read_manifest(target)
+        self.shared_blob_folder = blob_folder is not None
+        self.blob_folder = blob_folder if blob_folder is not None else target / BLOB_FOLDER_NAME
+        if not deduplicate:
+            self.blob_folder = None
+
+        # Switching between deduplicated and normal files requires staging all files again
+        self._manifest: dict[str, list] = manifest["files"] if manifest["deduplicate"] == deduplicate else {}
+        self._staged: dict[PurePosixPath, tuple[Path, Future[tuple[bool, list]]]] = {}
+        self._staging_folders: set[str] = set()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, jobs))
+        self._copy_times: list[float] = []  # Start and end time of the first and last copied file
+        self._lock = Lock()
+
+    def stage(self, files: dict[PurePosixPath, Path]) -> None:
+        """
+        Starts comparing and copying the given files, without waiting for them. Files that are staged again with
+        another source replace the earlier staged file.
+        """
+        for dst, src in files.items():
+            staged = self._staged.get(dst)
+            if staged is not None and staged[0] == src:
+                continue
+
+            # Wait for the earlier copy, so only one job writes the staged file
+            if staged is not None and not staged[1].cancel():
+                wait([staged[1]])
+
+            self._get_staging_folder(dst.parts[0])
+            self._staged[dst] = (src, self._executor.submit(self._stage, dst, src))
+
+    def commit(self, plan: CopyPlan) -> SyncStats:
+        try:
+            return self._commit(plan)
+        finally:
+            self._executor.shutdown()
+
+    def discard(self) -> None:
+        for _, future in self._staged.values():
+            future.cancel()
+
+        self._executor.shutdown()
+
+        for folder in self._staging_folders:
+            shutil.rmtree(self.target / f".{folder}.staging", ignore_errors=True)
+
+    def _commit(self, plan: CopyPlan) -> SyncStats:
+        stats = SyncStats()
+        new_manifest: dict[str, list] = {}
+        folder_changes = []
+        self.stage(plan.files)
+
+        # Files that were staged, but are not part of the plan, are not needed even if they could not be copied
+        for dst in [dst for dst in self._staged if dst not in plan.files]:
+            future = self._staged.pop(dst)[1]
+            if not future.cancel() and future.exception() is None and future.result()[0]:
+                (self._get_staging_folder(dst.parts[0]) / dst.relative_to(dst.parts[0])).unlink()
+
+        for folder in sorted(plan.folders):
+            changes = FolderChanges(folder, (self.target / folder).is_dir())
+            files = plan.get_files(folder)
+
+            for dst in files:
+                changed, new_manifest[str(dst)] = self._staged[dst][1].result()
+
+                if changed:
+                    changes.changed_files.append(dst)
+                    stats.copied_files += 1
+                    stats.copied_bytes += new_manifest[str(dst)][1]
+                else:
+                    changes.unchanged_files.append(dst)
+
+            for current_folder, _, current_files in os.walk(self.target / folder):
+                relative_folder = PurePosixPath(Path(current_folder).relative_to(self.target).as_posix())
+                changes.stale_files.update(
+                    relative_folder / f for f in current_files if relative_folder / f not in files
+                )
+
+            folder_changes.append(changes)
+            stats.unchanged_files += len(changes.unchanged_files)
+            stats.removed_files += len(changes.stale_files)
+
+        if self._copy_times:
+            stats.copy_seconds = max(self._copy_times) - min(self._copy_times)
+
+        # All files are copied, so the changed folders are replaced one after the other without any copying in between
+        for changes in folder_changes:
+            if not changes.needs_update:
+                continue
+
+            staging_folder = self._get_staging_folder(changes.folder)
+
+            for dst in changes.unchanged_files:
+                current_file = self.target / dst
+
+                if self.blob_folder is not None:
+                    file_hash = new_manifest[str(dst)][4]
+                    current_file = _store_blob(self.blob_folder, file_hash, current_file, self.backend, link=True)
+
+                _link_or_copy(current_file, staging_folder / dst.relative_to(changes.folder), self.backend)
+
+            swap_folders(staging_folder, self.target / changes.folder)
+
+            # Running containers can still use the replaced folder, so it is only removed when it is replaced again
+            old_folder = self.target / f".{changes.folder}.old"
+            if old_folder.exists():
+                shutil.rmtree(old_folder)
+
+            if staging_folder.exists():
+                staging_folder.rename(old_folder)
+
+        for folder in self._staging_folders:
+            shutil.rmtree(self.target / f".{folder}.staging", ignore_errors=True)
+
+        # Remove folders that are not part of the plan anymore and left-overs of interrupted runs
+        for f in self.target.iterdir():
+            if not f.is_dir():
+                continue
+
+            if not f.name.startswith(".") and f.name not in plan.folders:
+                stats.removed_files += sum(len(files) for _, _, files in os.walk(f))
+                shutil.rmtree(f)
+
+            # Replaced folders are kept until their folder is replaced again or is not part of the plan anymore
+            elif f.name.endswith(".staging") or (f.name.endswith(".old") and f.name[1:-4] not in plan.folders):
+                shutil.rmtree(f)
+
+        # Blobs that are not linked from the target folder anymore are not needed
+        if self.blob_folder is not None and not self.shared_blob_folder:
+            remove_unused_blobs(self.blob_folder)
+
+        elif self.blob_folder is None and (self.target / BLOB_FOLDER_NAME).is_dir():
+            shutil.rmtree(self.target / BLOB_FOLDER_NAME)
+
+        write_manifest(self.target, new_manifest, self.deduplicate)
+        return stats
+
+    def _get_staging_folder(self, folder: str) -> Path:
+        staging_folder = self.target / f".{folder}.staging"
+
+        # Staging folders of interrupted runs are incomplete
+        if folder not in self._staging_folders:
+            if staging_folder.exists():
+                shutil.rmtree(staging_folder)
+            staging_folder.mkdir()
+            self._staging_folders.add(folder)
+
+        return staging_folder
+
+    def _stage(self, dst: PurePosixPath, src: Path) -> tuple[bool, list]:
+        entry = self._manifest.get(str(dst))
+
+        if entry is not None and (self.target / dst).is_file():
+            entry = _get_unchanged_entry(src, self.target / dst, entry)
+            if entry is not None:
+                return False, entry
+
+        staged_file = self.target / f".{dst.parts[0]}.staging" / dst.relative_to(dst.parts[0])
+        staged_file.parent.mkdir(parents=True, exist_ok=True)
+        if staged_file.exists():
+            staged_file.unlink()
+
+        start_time = perf_counter()
+        entry = _stage_file(dst, src, staged_file, self.backend, self.blob_folder)
+
+        with self._lock:
+            self._copy_times.extend([start_time, perf_counter()])
+
+        return True, entry
+
+
+def remove_unused_blobs(blob_folder: Path) -> int:
+    """
+    Removes the blobs that are not linked from any target folder. Returns the number of removed blobs.
+    """
+    removed_blobs = 0
+
+    for folder, _, files in os.walk(blob_folder):
+        for f in files:
+            if os.stat(os.path.join(folder, f)).st_nlink == 1:
+                os.unlink(os.path.join(folder, f))
+                removed_blobs += 1
+
+    return removed_blobs
+
+
+def _stage_file(
+    dst: PurePosixPath, src: Path, staged_file: Path, backend: CopyBackend, blob_folder: Path | None
+) -> list:
+    src_stat = src.stat()
+
+    with profiler.span(COPY_CATEGORY, str(dst), src_stat.st_size):
+        file_hash = hash_file(src)
+
+        if blob_folder is None:
+            backend.copy(src, staged_file)
+        else:
+            _link_or_copy(_store_blob(blob_folder, file_hash, src, backend), staged_file, backend)
+
+    return [str(src), src_stat.st_size, src_stat.st_mtime_ns, staged_file.stat().st_mtime_ns, file_hash]
+
+
+def _store_blob(blob_folder: Path, file_hash: str, src: Path, backend: CopyBackend, link: bool = False) -> Path:
+    blob = blob_folder / file_hash[:2] / file_hash
+    if blob.exists():
+        return blob
+
+    blob.parent.mkdir(parents=True, exist_ok=True)
+
+    # Another thread or process can store the same content at the same time, so write to a unique name and rename it
+    temporary_blob = blob.with_name(f".{file_hash}.{os.getpid()}.{get_ident()}")
+    if link:
+        _link_or_copy(src, temporary_blob, backend)
+    else:
+        backend.copy(src, temporary_blob)
+
+    os.replace(temporary_blob, blob)
+    return blob
+
+
+def _get_unchanged_entry(src: Path, dst: Path, entry: list) -> list | None:
+    src_path, size, src_mtime, dst_mtime, file_hash = entry
+
+    try:
+        src_stat = src.stat()
+        dst_stat = dst.stat()
+    except OSError:
+        return None
+
+    # The copy in the target folder was changed by something else
+    if src_path != str(src) or dst_stat.st_size != size or dst_stat.st_mtime_ns != dst_mtime:
+        return None
+
+    if src_stat.st_size != size:
+        return None
+
+    if src_stat.st_mtime_ns == src_mtime:
+        return entry
+
+    # The source was touched, only copy it when the content changed
+    if hash_file(src) == file_hash:
+        return [src_path, size, src_stat.st_mtime_ns, dst_mtime, file_hash]
+
+    return None
+
+
+def _link_or_copy(src: Path, dst: Path, backend: CopyBackend) -> None:
+    dst.parent.mkdir(parents=True, exist_ok=True)
+
+    try:
+        os.link(src, dst)
+    except OSError:
+        backend.copy(src, dst)
+
+
+def hash_file(file: Path) -> str:
+    file_hash = sha256()
+
+    with open(file, "rb") as f:
+        while True:
+            buffer = f.read(_BUFFER_SIZE)
+            if not buffer:
+                break
+
+            file_hash.update(buffer)
+
+    return file_hash.hexdigest()
+
+
+def swap_folders(new_folder: Path, folder: Path) -> None:
+    """
+    Replaces folder by new_folder. If both exist, they are exchanged atomically when the kernel supports it, so the
+    old content ends up in new_folder.
+    """
+    if not folder.exists():
+        new_folder.rename(folder)
+        return
+
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+        if renameat2(_AT_FDCWD, os.fsencode(new_folder), _AT_FDCWD, os.fsencode(folder), _RENAME_EXCHANGE) == 0:
+            return
+
+    except (AttributeError, OSError):
+        pass
+
+    old_folder = folder.with_name(f".{folder.name}.old")
+    if old_folder.exists():
+        shutil.rmtree(old_folder)
+
+    folder.rename(old_folder)
+    new_folder.rename(folder)
+    old_folder.rename(new_folder)
+
+
+def read_manifest(target: Path) -> dict:
+    empty_manifest = {"version": MANIFEST_VERSION, "deduplicate": False, "files": {}}
+
+    try:
+        with open(target / MANIFEST_NAME, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    except (OSError, ValueError):
+        return empty_manifest
+
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return empty_manifest
+
+    return manifest
+
+
+def write_manifest(target: Path, files: dict[str, list], deduplicate: bool = False) -> None:
+    manifest_file = target / MANIFEST_NAME
+    temporary_file = target / f"{MANIFEST_NAME}.tmp"
+
+    with open(temporary_file, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "deduplicate": deduplicate, "files": files}, f)
+
+    os.replace(temporary_file, manifest_file)
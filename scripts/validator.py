@@ -1,14 +1,22 @@
 from __future__ import annotations
 
-from collections.abc import Callable
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from enum import Enum, auto
-from xml.etree import ElementTree
-
-from rospkg.common import ResourceNotFound
+from hashlib import sha256
+from os import environ
+from pathlib import Path
+from threading import Lock
+from typing import TYPE_CHECKING
+
+from disk_cache import read_json, write_json
+from fingerprint import ENVIRONMENT_VARIABLES
+from mesh_scanner import find_invalid_texture_references
+from package_resolver import ResourceNotFound
+from profiler import profiler
 from workspace import Workspace
 
-COLLADA_NS = "{http://www.collada.org/2005/11/COLLADASchema}"
 ALLOWED_GAZEBO_PLUGINS = (
     "libgazebo_ros_camera.so",
     "libgazebo_ros_multicamera.so",
@@ -19,47 +27,289 @@ ALLOWED_GAZEBO_PLUGINS = (
     "libgazebo_ros_bumper.so",
     "librealsense_gazebo_plugin.so",
 )  # All allowed sensor plugins. No other plugins will be installed in the simulation container.
+CACHE_VERSION = 1
+ROBOT_INPUT_EXTENSIONS = (".launch", ".xacro", ".urdf", ".gazebo")  # Files that can change the robot description
 
 
 class ValidationResult(Enum):
     ERROR = auto()
     OK = auto()
     WARNING = auto()
+    SKIPPED = auto()
 
 
 @dataclass
 class ValidationFeedback:
     result: ValidationResult
     msg: str = ""
+    cached: bool = False  # Whether the feedback is the saved feedback of an earlier run
+
+
+if TYPE_CHECKING:
+    ValidationCheck = Callable[[Workspace], ValidationFeedback]
+    CheckInputs = Callable[[Workspace], Iterable[Path]]
 
 
 class Validation:
-    def __init__(self) -> None:
-        self.validation_checks: list[Callable[[Workspace], ValidationFeedback]] = []
-
-    def register(self, f: Callable[[Workspace], ValidationFeedback]) -> None:
-        self.validation_checks.append(f)
-
-    def validate_all(self, ws: Workspace) -> bool:
-        for ck in self.validation_checks:
-            name = ck.__name__.replace("check_", "").replace("_", " ").capitalize()
-            fdbck = ck(ws)
-
-            if fdbck.result == ValidationResult.ERROR:
-                color = "\033[91m"
-                sign = "\u2718"
-            elif fdbck.result == ValidationResult.WARNING:
-                color = "\033[93m"
-                sign = "\u003f"
-            else:
-                sign = "\u2714"
-                color = "\033[92m"
-
-            print(f"{color}{sign} {name : <20}\t: {fdbck.msg}\033[0m")
-            if fdbck.result == ValidationResult.ERROR:
+    """
+    Runs the registered checks on a workspace. Checks that declare their input files and passed are only run again
+    when one of these files changed: their feedback is saved on disk, together with the size and modification time
+    of every input file, the version of the check and the environment variables, and is used again as long as these
+    did not change and no input file was added.
+    """
+
+    def __init__(self, use_cache: bool = True) -> None:
+        self.validation_checks: list[ValidationCheck] = []
+        self.dependencies: dict[ValidationCheck, tuple[ValidationCheck, ...]] = {}
+        self.inputs: dict[ValidationCheck, tuple[CheckInputs, int]] = {}  # Input files and version of every check
+        self.feedback: dict[ValidationCheck, ValidationFeedback] = {}
+        self.use_cache = use_cache
+
+        self._cache: dict[str, dict] = {}  # Saved feedback of the workspace that is validated
+        self._cache_lock = Lock()
+
+    def register(
+        self,
+        f: ValidationCheck | None = None,
+        *,
+        depends_on: Iterable[ValidationCheck] = (),
+        inputs: CheckInputs | None = None,
+        version: int = 1,
+    ) -> ValidationCheck | Callable[[ValidationCheck], ValidationCheck]:
+        """
+        Registers a check, which runs after the checks it depends on. The inputs function returns all files the
+        feedback of the check depends on. Increase the version when the check changes, so its saved feedback is not
+        used anymore.
+        """
+        depends_on = tuple(depends_on)
+
+        def register_check(f: ValidationCheck) -> ValidationCheck:
+            for dependency in depends_on:
+                if dependency not in self.validation_checks:
+                    raise ValueError(f"Register {dependency.__name__} before {f.__name__}, which depends on it")
+
+            self.validation_checks.append(f)
+            self.dependencies[f] = depends_on
+            if inputs is not None:
+                self.inputs[f] = (inputs, version)
+            return f
+
+        return register_check if f is None else register_check(f)
+
+    def validate_all(
+        self,
+        ws: Workspace,
+        jobs: int = 1,
+        collect_all: bool = False,
+        checks: Iterable[ValidationCheck] | None = None,
+        on_feedback: Callable[[ValidationCheck, ValidationFeedback], None] | None = None,
+    ) -> bool:
+        """
+        Runs the given checks, or all checks, together with the checks they depend on. The feedback of every check
+        that ran is kept in feedback and passed to on_feedback as soon as it is reported.
+        """
+        valid = True
+        checks = self.validation_checks if checks is None else self._add_dependencies(checks)
+        cache_name = (
+            f"validation/{sha256(str(ws.workspace_folder).encode('utf-8', 'surrogateescape')).hexdigest()}.json"
+        )
+        cache = read_json(cache_name) if self.use_cache else None
+        self._cache = cache["checks"] if isinstance(cache, dict) and cache.get("version") == CACHE_VERSION else {}
+        results = self._run_parallel(ws, checks, jobs) if jobs > 1 else self._run_sequential(ws, checks)
+
+        try:
+            # Results are always reported in the order the checks are registered
+            for ck, fdbck in results:
+                self.feedback[ck] = fdbck
+                self.print_feedback(ck, fdbck)
+
+                if on_feedback is not None:
+                    on_feedback(ck, fdbck)
+
+                # Checks that were skipped could not check the workspace, so the files cannot be used either
+                if fdbck.result in (ValidationResult.ERROR, ValidationResult.SKIPPED):
+                    valid = False
+
+                if fdbck.result == ValidationResult.ERROR and not collect_all:
+                    break
+        finally:
+            results.close()
+
+            if self.use_cache:
+                write_json(cache_name, {"version": CACHE_VERSION, "checks": self._cache})
+
+        return valid
+
+    def _add_dependencies(self, checks: Iterable[ValidationCheck]) -> list[ValidationCheck]:
+        selected_checks = set(checks)
+
+        # Dependencies are always registered before the checks that depend on them
+        for ck in reversed(self.validation_checks):
+            if ck in selected_checks:
+                selected_checks.update(self.dependencies[ck])
+
+        return [ck for ck in self.validation_checks if ck in selected_checks]
+
+    def _run_sequential(
+        self, ws: Workspace, checks: list[ValidationCheck]
+    ) -> Iterator[tuple[ValidationCheck, ValidationFeedback]]:
+        feedback: dict[ValidationCheck, ValidationFeedback] = {}
+
+        for ck in checks:
+            feedback[ck] = self._run_check(ck, ws, [feedback[d] for d in self.dependencies[ck]])
+            yield ck, feedback[ck]
+
+    def _run_parallel(
+        self, ws: Workspace, checks: list[ValidationCheck], jobs: int
+    ) -> Iterator[tuple[ValidationCheck, ValidationFeedback]]:
+        futures: dict[ValidationCheck, Future[ValidationFeedback]] = {}
+
+        # Checks wait for their dependencies in the worker. Dependencies are always submitted earlier, so they are
+        # already running or done when a check that depends on them starts.
+        def run(ck: ValidationCheck) -> ValidationFeedback:
+            return self._run_check(ck, ws, [futures[d].result() for d in self.dependencies[ck]])
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            try:
+                for ck in checks:
+                    futures[ck] = executor.submit(run, ck)
+
+                for ck in checks:
+                    yield ck, futures[ck].result()
+
+            finally:
+                for future in futures.values():
+                    future.cancel()
+
+    def _run_check(
+        self, ck: ValidationCheck, ws: Workspace, dependency_feedback: list[ValidationFeedback]
+    ) -> ValidationFeedback:
+        # Checks only run when all checks they depend on passed, a warning means these could not check everything
+        for dependency, fdbck in zip(self.dependencies[ck], dependency_feedback):
+            if fdbck.result != ValidationResult.OK:
+                msg = f"Skipped, because '{self.get_name(dependency)}' did not pass."
+                return ValidationFeedback(ValidationResult.SKIPPED, msg)
+
+        if ck not in self.inputs or not self.use_cache:
+            return self._call_check(ck, ws)
+
+        get_inputs, version = self.inputs[ck]
+        with self._cache_lock:
+            entry = self._cache.get(ck.__name__)
+
+        try:
+            input_files = {str(f) for f in get_inputs(ws)}
+        except (OSError, SyntaxError, KeyError, ResourceNotFound):
+            # The check reports why the inputs cannot be found
+            input_files = None
+
+        if input_files is not None and self._is_valid(entry, version, input_files):
+            return ValidationFeedback(ValidationResult[entry["result"]], entry["msg"], cached=True)
+
+        fdbck = self._call_check(ck, ws)
+
+        # Checks that did not pass can depend on things that are not input files, like a package that is installed
+        # later, so only their passing feedback is saved
+        if fdbck.result != ValidationResult.OK:
+            with self._cache_lock:
+                self._cache.pop(ck.__name__, None)
+            return fdbck
+
+        try:
+            # Files that were found while running the check, like the resources of the robot, are inputs as well
+            input_files = {str(f) for f in get_inputs(ws)}.union(input_files or ())
+            variables = set(ENVIRONMENT_VARIABLES).union(ws.get_used_environment_variables())
+        except (OSError, SyntaxError, KeyError, ResourceNotFound):
+            with self._cache_lock:
+                self._cache.pop(ck.__name__, None)
+            return fdbck
+
+        entry = {
+            "version": version,
+            "stamps": {f: _get_stamp(f) for f in sorted(input_files)},
+            "environment": {variable: environ.get(variable) for variable in sorted(variables)},
+            "result": fdbck.result.name,
+            "msg": fdbck.msg,
+        }
+        with self._cache_lock:
+            self._cache[ck.__name__] = entry
+
+        return fdbck
+
+    def _call_check(self, ck: ValidationCheck, ws: Workspace) -> ValidationFeedback:
+        # A check that fails unexpectedly is reported like any other error, so the other checks are still reported
+        try:
+            with profiler.span("check", self.get_name(ck)):
+                return ck(ws)
+
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}" if str(exc) else type(exc).__name__
+            return ValidationFeedback(ValidationResult.ERROR, f"Check failed: {error}")
+
+    @staticmethod
+    def _is_valid(entry: dict | None, version: int, input_files: set[str]) -> bool:
+        if not isinstance(entry, dict) or entry.get("version") != version:
+            return False
+
+        # Input files that were added since the feedback was saved can change the feedback as well
+        if not input_files.issubset(entry["stamps"]):
+            return False
+
+        for variable, value in entry["environment"].items():
+            if environ.get(variable) != value:
                 return False
 
-        return True
+        return all(_get_stamp(file) == stamp for file, stamp in entry["stamps"].items())
+
+    @staticmethod
+    def get_name(ck: ValidationCheck) -> str:
+        return ck.__name__.replace("check_", "").replace("_", " ").capitalize()
+
+    @staticmethod
+    def print_feedback(ck: ValidationCheck, fdbck: ValidationFeedback) -> None:
+        name = Validation.get_name(ck)
+
+        if fdbck.result == ValidationResult.ERROR:
+            color = "\033[91m"
+            sign = "\u2718"
+        elif fdbck.result in (ValidationResult.WARNING, ValidationResult.SKIPPED):
+            color = "\033[93m"
+            sign = "\u003f"
+        else:
+            sign = "\u2714"
+            color = "\033[92m"
+
+        msg = f"{fdbck.msg} (cached)" if fdbck.cached else fdbck.msg
+        print(f"{color}{sign} {name : <20}\t: {msg}\033[0m")
+
+
+def _get_stamp(file: str) -> list[int]:
+    try:
+        file_stat = Path(file).stat()
+    except OSError:
+        return []
+
+    return [file_stat.st_size, file_stat.st_mtime_ns]
+
+
+def _get_world_inputs(ws: Workspace) -> list[Path]:
+    # Every world file is used and includes models by the name of their folder
+    return ws.files.find_by_extension(".world") + ws.files.find_by_name("model.sdf")
+
+
+def _get_mesh_inputs(ws: Workspace) -> list[Path]:
+    # Only stat the meshes, finding the meshes of the used models needs the world files to be read
+    return _get_world_inputs(ws) + ws.files.find_by_extension(".dae")
+
+
+def _get_robot_inputs(ws: Workspace) -> list[Path]:
+    files = [f for extension in ROBOT_INPUT_EXTENSIONS for f in ws.files.find_by_extension(extension)]
+    files.extend(ws.files.find_by_name("package.xml"))
+
+    # The used robot descriptions and their resources can be in packages outside the workspace
+    files.extend(node.file for node in ws.graph.nodes)
+    files.extend(ws.graph.resources())
+    return files
 
 
 # Create validator to check the folder structure, meshes etc.
@@ -88,7 +338,7 @@ def check_find_gazebo_resources(ws: Workspace) -> ValidationFeedback:
         return ValidationFeedback(ValidationResult.ERROR, msg)
 
 
-@validator.register
+@validator.register(inputs=_get_world_inputs)
 def check_world_file(ws: Workspace) -> ValidationFeedback:
     model_files = ws.get_all_used_model_files()
     _found_world_file = False
@@ -99,16 +349,14 @@ def check_world_file(ws: Workspace) -> ValidationFeedback:
 
         # Empty <materials></materials> tags don't work using GZWeb. Raise error if they are in the world file.
         # Probably because of old world template
-        root = ElementTree.parse(model_file).getroot()
-        for m_tag in root.findall(".//materials"):
-            if m_tag.text is None:
-                msg = (
-                    f"The model file '{model_file}' contains empty <materials></materials>"
-                    " tags. This gives a problem in visualisation of the environment. Update"
-                    " the virtual_maize_field package to the newest version or manually remove"
-                    " the empty <materials></materials>tags from the world file."
-                )
-                return ValidationFeedback(ValidationResult.ERROR, msg)
+        if ws.scan_world_file(model_file).has_empty_materials:
+            msg = (
+                f"The model file '{model_file}' contains empty <materials></materials>"
+                " tags. This gives a problem in visualisation of the environment. Update"
+                " the virtual_maize_field package to the newest version or manually remove"
+                " the empty <materials></materials>tags from the world file."
+            )
+            return ValidationFeedback(ValidationResult.ERROR, msg)
 
     if not _found_world_file:
         msg = (
@@ -121,7 +369,7 @@ def check_world_file(ws: Workspace) -> ValidationFeedback:
     return ValidationFeedback(ValidationResult.OK, msg)
 
 
-@validator.register
+@validator.register(inputs=_get_robot_inputs)
 def check_dependencies(ws: Workspace) -> ValidationFeedback:
     try:
         resources = ws.get_all_dependend_packages()
@@ -141,45 +389,49 @@ def check_dependencies(ws: Workspace) -> ValidationFeedback:
         return ValidationFeedback(ValidationResult.WARNING, msg)
 
 
-@validator.register
+@validator.register(inputs=_get_mesh_inputs)
 def check_mesh_files(ws: Workspace) -> ValidationFeedback:
     model_files = ws.get_all_used_model_files()
 
-    i = 0
+    # Models in the same folder share their meshes, so every mesh is only scanned once
+    mesh_files = []
     for model_file in model_files:
-        for mesh_file in model_file.parent.glob("**/*.dae"):
-            i += 1
-
-            root = ElementTree.parse(mesh_file).getroot()
-            for init_tag in root.findall(f".//{COLLADA_NS}init_from"):
-                if (
-                    init_tag.text.endswith(".png") or init_tag.text.endswith(".jpg") or init_tag.text.endswith(".jpeg")
-                ) and "../materials/textures" not in init_tag.text:
-                    msg = (
-                        f"Texture '{ init_tag.text.split('/')[-1] }' in"
-                        f" '{mesh_file.parents[1]}' should be placed in the folder"
-                        f" {mesh_file.parents[1]}/materials/textures'. Move the file to this"
-                        f" folder and edit the '{mesh_file.name} file."
-                    )
-                    return ValidationFeedback(ValidationResult.ERROR, msg)
-
-    msg = f"All {i} meshes in { len(model_files) } models files are valid"
+        mesh_files.extend(ws.files.find_by_extension(".dae", model_file.parent))
+    mesh_files = list(dict.fromkeys(mesh_files))
+
+    invalid_textures = find_invalid_texture_references(mesh_files)
+
+    if len(invalid_textures) > 0:
+        msgs = []
+        for mesh_file, textures in invalid_textures.items():
+            for texture in textures:
+                msgs.append(
+                    f"Texture '{ texture.split('/')[-1] }' in"
+                    f" '{mesh_file.parents[1]}' should be placed in the folder"
+                    f" {mesh_file.parents[1]}/materials/textures'. Move the file to this"
+                    f" folder and edit the '{mesh_file.name} file."
+                )
+
+        msg = "\n\t\t\t  ".join(msgs)
+        return ValidationFeedback(ValidationResult.ERROR, msg)
+
+    msg = f"All {len(mesh_files)} meshes in { len(model_files) } models files are valid"
     return ValidationFeedback(ValidationResult.OK, msg)
 
 
-@validator.register
+@validator.register(depends_on=(check_dependencies,), inputs=_get_robot_inputs)
 def check_gazebo_plugins(ws: Workspace) -> ValidationFeedback:
     xacro_files = ws.get_all_used_xacro_files()
     used_plugins = []
 
     for xacro_file in xacro_files:
-        for plugin_tag in xacro_file.urdf_root.findall(".//plugin"):
-            used_plugins.append(plugin_tag.attrib["filename"])
+        for plugin_filename in xacro_file.plugin_filenames:
+            used_plugins.append(plugin_filename)
 
-            if plugin_tag.attrib["filename"] not in ALLOWED_GAZEBO_PLUGINS:
+            if plugin_filename not in ALLOWED_GAZEBO_PLUGINS:
                 allowed_plugin_str = ", ".join(ALLOWED_GAZEBO_PLUGINS)
                 msg = (
-                    f"Gazebo plugin '{plugin_tag.attrib['filename']}' used in"
+                    f"Gazebo plugin '{plugin_filename}' used in"
                     f" '{xacro_file.urdf_file.name}' is not allowed in the"
                     f" competition! Allowed sensor plugins are: {allowed_plugin_str}"
                 )
@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import ctypes
+import errno
+import os
+import struct
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from select import select
+from time import monotonic
+from typing import TYPE_CHECKING
+
+from disk_cache import CACHE_FOLDER
+from package_resolver import package_resolver
+from sync import CopyPlan
+from validator import (
+    ValidationResult,
+    check_dependencies,
+    check_find_gazebo_resources,
+    check_gazebo_plugins,
+    check_mesh_files,
+    check_world_file,
+    validator,
+)
+from workspace import Workspace
+
+if TYPE_CHECKING:
+    from validator import ValidationCheck
+
+DEBOUNCE_SECONDS = 0.5  # Time without changes before the changes are applied
+MAX_DEBOUNCE_SECONDS = 5.0  # Changes are applied after this time, even if files are still changing
+AFFECTED_CHECKS = {
+    ".world": (check_world_file, check_mesh_files),
+    ".sdf": (check_world_file, check_mesh_files),
+    ".config": (check_world_file, check_mesh_files),
+    ".dae": (check_mesh_files,),
+    ".launch": (check_dependencies, check_gazebo_plugins),
+    ".xacro": (check_dependencies, check_gazebo_plugins),
+    ".urdf": (check_dependencies, check_gazebo_plugins),
+    ".gazebo": (check_dependencies, check_gazebo_plugins),
+    ".xml": (check_dependencies, check_gazebo_plugins),
+    ".material": (check_find_gazebo_resources,),
+}  # Checks that have to run again when a file with the extension changes
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = (
+    IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+_EVENT_HEADER = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+
+class Inotify:
+    """
+    Watches folders for changed, added and removed files with the inotify API of Linux. Events are returned as the
+    paths that changed. If the kernel dropped events, because too many files changed, all watched files should be
+    considered as changed.
+    """
+
+    def __init__(self) -> None:
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "Could not initialise inotify")
+
+        self._folders: dict[int, Path] = {}
+        self._watches: dict[Path, int] = {}
+
+    def __enter__(self) -> Inotify:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def set_folders(self, folders: Iterable[Path]) -> None:
+        folders = set(folders)
+
+        for folder in set(self._watches).difference(folders):
+            self._libc.inotify_rm_watch(self.fd, self._watches.pop(folder))
+
+        for folder in folders.difference(self._watches):
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+
+            # Folders that are removed or are not readable can not be watched
+            if wd < 0:
+                continue
+
+            self._watches[folder] = wd
+            self._folders[wd] = folder
+
+    def read(self, timeout: float | None = None) -> tuple[set[Path], bool]:
+        """
+        Waits at most timeout seconds for events. Returns the changed paths and whether events were dropped.
+        """
+        changed_paths: set[Path] = set()
+        overflow = False
+
+        if not select([self.fd], [], [], timeout)[0]:
+            return changed_paths, overflow
+
+        while True:
+            try:
+                data = os.read(self.fd, _READ_SIZE)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    break
+                raise
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + _EVENT_HEADER.size : offset + _EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += _EVENT_HEADER.size + length
+
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+
+                folder = self._folders.get(wd)
+                if folder is None:
+                    continue
+
+                if mask & IN_IGNORED:
+                    self._folders.pop(wd)
+                    self._watches.pop(folder, None)
+
+                changed_paths.add(folder / os.fsdecode(name) if name else folder)
+
+        return changed_paths, overflow
+
+    def wait(self, debounce: float = DEBOUNCE_SECONDS) -> tuple[set[Path], bool]:
+        """
+        Waits for changes and returns them after no changes happened for debounce seconds, so files that are written
+        in multiple steps, like a generated world, are handled at once.
+        """
+        changed_paths, overflow = self.read()
+        start_time = monotonic()
+
+        while monotonic() - start_time < MAX_DEBOUNCE_SECONDS:
+            more_changed_paths, more_overflow = self.read(debounce)
+            if not more_changed_paths and not more_overflow:
+                break
+
+            changed_paths.update(more_changed_paths)
+            overflow = overflow or more_overflow
+
+        return changed_paths, overflow
+
+
+def get_affected_checks(changed_paths: Iterable[Path]) -> set[ValidationCheck]:
+    affected_checks = set()
+
+    for path in changed_paths:
+        affected_checks.update(AFFECTED_CHECKS.get(path.suffix.lower(), ()))
+
+    return affected_checks
+
+
+def get_watched_folders(ws: Workspace, plan: CopyPlan | None) -> set[Path]:
+    """
+    Returns the folders of all files that are used by the validation checks or copied to the simulation files.
+    """
+    folders = {node.file.parent for node in ws.graph.nodes}
+    folders.update(f.parent for f in ws.files.find_by_extension(".launch"))
+    folders.update(f.parent for f in ws.files.find_by_extension(".world"))
+    folders.update(f.parent for f in ws.files.find_by_name("model.sdf"))
+
+    if plan is not None:
+        for src_folder in {src.parent for src in plan.files.values()}:
+            # Variants of files in the cache folder are written by the scripts themselves
+            if CACHE_FOLDER in src_folder.parents:
+                continue
+
+            folders.add(src_folder)
+
+            # Watch the parent folders in the workspace as well, so added folders are found
+            for folder in src_folder.parents:
+                if folder in folders or ws.workspace_folder not in folder.parents:
+                    break
+
+                folders.add(folder)
+
+    return {f for f in folders if f.is_dir()}
+
+
+def watch(
+    ws: Workspace,
+    copy_files: Callable[[Workspace], CopyPlan],
+    plan: CopyPlan | None = None,
+    jobs: int = 1,
+    debounce: float = DEBOUNCE_SECONDS,
+) -> None:
+    """
+    Keeps the simulation files in sync with the workspace until it is interrupted. After files changed, only the
+    checks that use these files and the checks that did not pass before are run again. The files are copied when all
+    checks pass, which only copies the changed files.
+    """
+    with Inotify() as inotify:
+        while True:
+            inotify.set_folders(get_watched_folders(ws, plan))
+            print("\nWatching for changes, press Ctrl+C to stop.")
+
+            changed_paths, overflow = inotify.wait(debounce)
+            changed_files = {p for p in changed_paths if not p.is_dir()}
+            print(f"\n{len(changed_paths)} files changed.")
+
+            if any(p.name == "package.xml" for p in changed_paths):
+                package_resolver.clear()
+
+            ws.invalidate(changed_files)
+
+            # Checks that did not pass could depend on files that are not watched, so they always run again
+            checks = get_affected_checks(changed_paths)
+            checks.update(ck for ck, fdbck in validator.feedback.items() if fdbck.result != ValidationResult.OK)
+
+            if overflow or not validator.feedback:
+                checks = set(validator.validation_checks)
+
+            if validator.validate_all(ws, jobs=jobs, checks=checks):
+                print("\nCopy files:")
+                plan = copy_files(ws)
+
+                # Containers keep the bind mounted folders they started with, see SyncSession
+                print("Restart running containers (docker-compose restart) to use the copied files.")
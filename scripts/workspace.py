@@ -1,76 +1,139 @@
 from __future__ import annotations
 
+from collections.abc import Iterable
 from os import environ
 from pathlib import Path
-from re import compile, finditer, search
+from re import compile, search
+from threading import Lock
 from typing import TypeVar
 from xml.etree import ElementTree
 
-import rospkg
-from rospkg import RosPack
-from rospkg.common import ResourceNotFound
-from xacro import process_file as process_xacro_file
+from dependency_graph import DependencyGraph
+from document_cache import DocumentCache
+from file_index import DEFAULT_IGNORED_DIRECTORIES, FileIndex
+from launch_graph import ENTRY_LAUNCH_FILE, LaunchReference, launch_graph
+from package_resolver import ResourceNotFound, package_resolver
+from world_scanner import WorldScan, scan_world_file
+from xacro_cache import ENVIRONMENT_REGEX, xacro_cache
 
 _T = TypeVar("_T")
 _URDF_EXTENSIONS = (".world", ".sdf", ".xacro", ".urdf")
+_OPTENV_LOCK = Lock()
 
 
 class URDF:
+    """
+    Record of a xacro or URDF file with the information the scripts need from its expanded tree: the Gazebo plugins,
+    the Gazebo materials with the URIs of their scripts and the optenv variables. The record of a file is made once, when the dependency graph loads
+    the file, and is shared through URDF.get. The tree itself is not kept, but parsed again through the document
+    cache when urdf_root is used. Records are equal when their files are equal.
+    """
+
+    __slots__ = ("urdf_file", "graph", "plugin_filenames", "material_names", "material_uris", "optenv_names")
+
     PACKAGE_REGEX = compile(r"package:\/\/(.+?)\/(.+\..+)")
     FIND_REGEX = compile(r"\$\(find (.+)\)\/(.+\..+)")
     OPTENV_REGEX = compile(r"\$\(optenv (.+) (.+)\)")
 
-    def __init__(self, urdf_file: Path) -> None:
+    # Values of the optenv variables that are used instead of asking the user, variables without a value are set to 0
+    optenv_settings: dict[str, str] | None = None
+
+    def __init__(
+        self, urdf_file: Path, graph: DependencyGraph | None = None, urdf_root: ElementTree.Element | None = None
+    ) -> None:
         self.urdf_file = urdf_file
-        self.urdf_root = self.parse_file(self.urdf_file)
+        self.graph = graph if graph is not None else URDF.create_dependency_graph()
+
+        if urdf_root is None:
+            urdf_root = self.urdf_root
+
+        self.plugin_filenames = tuple(p.attrib["filename"] for p in urdf_root.iterfind(".//plugin[@filename]"))
+        # Materials are used by name, like <material>Gazebo/Grey</material>, or by a script with a name and its URIs
+        materials = list(urdf_root.iterfind(".//gazebo//material"))
+        self.material_names = tuple(
+            [(m.text or "").strip() for m in materials]
+            + [(n.text or "").strip() for m in materials for n in m.iterfind("script/name")]
+        )
+        self.material_uris = tuple((u.text or "").strip() for m in materials for u in m.iterfind("script/uri"))
+        self.optenv_names = (
+            tuple(URDF.get_optenv_names(self.graph.documents.parse(urdf_file))) if urdf_file.suffix == ".xacro" else ()
+        )
+
+    @staticmethod
+    def get(urdf_file: Path, graph: DependencyGraph) -> URDF:
+        """
+        Returns the shared record of a file in the dependency graph.
+        """
+        urdf = graph.get_data(urdf_file)
+
+        # Files that include themselves are still loading, so they do not have a record yet
+        return urdf if isinstance(urdf, URDF) else URDF(urdf_file, graph)
 
     def __repr__(self) -> str:
         return f"URDF file ({self.urdf_file.name})"
 
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, URDF) and self.urdf_file == other.urdf_file
+
+    def __hash__(self) -> int:
+        return hash(self.urdf_file)
+
+    @property
+    def urdf_root(self) -> ElementTree.Element:
+        return self.parse_file(self.urdf_file, self.graph)
+
+    @property
+    def packages(self) -> list[str]:
+        return self.graph.get_dependencies(self.urdf_file)[0]
+
+    @property
+    def resources(self) -> list[Path]:
+        return self.graph.get_dependencies(self.urdf_file)[1]
+
     def get_all_dependend_xacro_or_urdf_files(self) -> list[URDF]:
         all_used_files = [self]
 
-        for used_file in self.get_all_dependencies(self.urdf_root)[1]:
+        for used_file in self.graph.get_dependencies(self.urdf_file)[1]:
             if used_file.suffix in _URDF_EXTENSIONS:
-                all_used_files.append(URDF(used_file))
+                all_used_files.append(URDF.get(used_file, self.graph))
 
         return all_used_files
 
     def get_all_dependend_packages(self) -> list[str]:
-        all_used_packages = []
-
-        for used_file in self.get_all_dependencies(self.urdf_root)[0]:
-            all_used_packages.append(used_file)
+        return self.graph.get_dependencies(self.urdf_file)[0]
 
-        return list(set(all_used_packages))
+    @staticmethod
+    def create_dependency_graph(documents: DocumentCache | None = None) -> DependencyGraph:
+        return DependencyGraph(
+            documents if documents is not None else DocumentCache(), URDF.get_file_dependencies, _URDF_EXTENSIONS
+        )
 
     @staticmethod
-    def get_all_dependencies(xml: Path | ElementTree.Element) -> tuple[list[str], list[Path]]:
-        packages = []
-        resources = []
+    def get_all_dependencies(
+        xml: Path | ElementTree.Element, graph: DependencyGraph | None = None
+    ) -> tuple[list[str], list[Path]]:
+        if graph is None:
+            graph = URDF.create_dependency_graph()
 
         if isinstance(xml, Path):
-            xml = URDF.parse_file(xml)
-
-        packages_, resources_ = URDF.get_dependencies_from_element(xml)
-
-        packages.extend(packages_)
-        resources.extend(resources_)
+            return graph.get_dependencies(xml)
 
-        packages = URDF.remove_double_instances(packages)
-        resources = URDF.remove_double_instances(resources)
+        # Elements are not part of the graph, but the files they use are
+        packages, resources = URDF.get_dependencies_from_element(xml)
+        used_files = [r for r in resources if r.suffix.lower() in _URDF_EXTENSIONS]
 
-        for resource in resources:
-            if resource.suffix.lower() in _URDF_EXTENSIONS:
-                packages_, resources_ = URDF.get_all_dependencies(resource)
+        packages = sorted(graph.packages(used_files).union(packages))
+        resources = sorted(graph.resources(used_files).union(resources))
 
-                packages.extend(packages_)
-                resources.extend(resources_)
+        return packages, resources
 
-                packages = URDF.remove_double_instances(packages)
-                resources = URDF.remove_double_instances(resources)
+    @staticmethod
+    def get_file_dependencies(file: Path, graph: DependencyGraph) -> tuple[list[str], list[Path], URDF]:
+        urdf_root = URDF.parse_file(file, graph)
+        packages, resources = URDF.get_dependencies_from_element(urdf_root)
 
-        return packages, resources
+        # The record is made from the same tree, so the tree does not have to be kept for it
+        return packages, resources, URDF(file, graph, urdf_root)
 
     @staticmethod
     def get_dependencies_from_element(xml_root: ElementTree.Element) -> tuple[list[str], list[Path]]:
@@ -106,7 +169,7 @@ class URDF:
             relative_path = resource_path[1:] if resource_path.startswith("/") else resource_path
 
             try:
-                resource_path = Path(RosPack().get_path(package_name)) / relative_path
+                resource_path = Path(package_resolver.get_path(package_name)) / relative_path
 
                 if not resource_path.is_file():
                     raise FileNotFoundError(f"Could not resolve file {resource_path} in {tag.attrib['filename']}")
@@ -125,43 +188,62 @@ class URDF:
         return list(set(input))
 
     @staticmethod
-    def parse_file(file: Path) -> ElementTree.Element:
-        xml_raw = ElementTree.parse(file).getroot()
+    def parse_file(file: Path, graph: DependencyGraph | None = None) -> ElementTree.Element:
+        if graph is None:
+            graph = URDF.create_dependency_graph()
 
         if file.suffix != ".xacro":
-            return xml_raw
+            return graph.documents.parse(file)
 
-        # Fix for env variables in xacro
-        def parse_optenv_statement(xml: ElementTree.Element, element: str) -> list[str]:
-            optenv_list = []
-            for statement in xml.findall(".//{http://www.ros.org/wiki/xacro}" + element):
-                if "optenv" in statement.attrib["value"]:
-                    variable = search(URDF.OPTENV_REGEX, statement.attrib["value"])
+        return graph.documents.load(file, "xacro", lambda: URDF.expand_xacro_file(file, graph))
 
-                    if variable is not None:
-                        name, _ = variable.groups()
-                        optenv_list.append(name)
+    @staticmethod
+    def expand_xacro_file(file: Path, graph: DependencyGraph) -> ElementTree.Element:
+        xml_raw = graph.documents.parse(file)
+
+        optenv_list = URDF.get_optenv_names(xml_raw)
+
+        # Get optenv from all dependend URDF files
+        for used_file in URDF.get_all_dependencies(xml_raw, graph)[1]:
+            if used_file.suffix in _URDF_EXTENSIONS:
+                optenv_list.extend(URDF.get_optenv_names(graph.documents.parse(used_file)))
 
-            return optenv_list
+        # Only ask one question at a time when files are expanded by multiple threads
+        with _OPTENV_LOCK:
+            URDF.ask_optenv_variables(optenv_list)
 
+        # After setting the environ variables, parse the file again using xacro
+        return ElementTree.fromstring(xacro_cache.expand(file))
+
+    @staticmethod
+    def get_optenv_names(xml_raw: ElementTree.Element) -> list[str]:
+        """
+        Returns the optenv variables that are used by the conditions in a xacro file that is not expanded.
+        """
         optenv_list = []
 
-        # Add optenv from current file
-        optenv_list.extend(parse_optenv_statement(xml_raw, "if"))
-        optenv_list.extend(parse_optenv_statement(xml_raw, "unless"))
+        for element in ("if", "unless"):
+            for statement in xml_raw.iterfind(".//{http://www.ros.org/wiki/xacro}" + element):
+                variable = search(URDF.OPTENV_REGEX, statement.attrib["value"])
 
-        # Get optenv from all dependend URDF files
-        for used_file in URDF.get_all_dependencies(xml_raw)[1]:
-            if used_file.suffix in _URDF_EXTENSIONS:
-                dep_xml_raw = ElementTree.parse(file).getroot()
-                optenv_list.extend(parse_optenv_statement(dep_xml_raw, "if"))
-                optenv_list.extend(parse_optenv_statement(dep_xml_raw, "unless"))
+                if variable is not None:
+                    name, _ = variable.groups()
+                    optenv_list.append(name)
 
+        return optenv_list
+
+    @staticmethod
+    def ask_optenv_variables(optenv_list: list[str]) -> None:
         optenv_list = sorted(URDF.remove_double_instances(optenv_list))
         optenv_list = [v for v in optenv_list if v not in environ]
 
+        # Use the given settings when the scripts run without a user, like in batch mode
+        if URDF.optenv_settings is not None:
+            for optenv_variable in optenv_list:
+                environ[optenv_variable] = URDF.optenv_settings.get(optenv_variable, "0")
+
         # Ask to set the variables if not done yet
-        if len(optenv_list) > 0:
+        elif len(optenv_list) > 0:
             print(
                 f"Your robot URDF file contains {len(optenv_list)} options that are set using environment "
                 f"variables. Indicate for each of the {len(optenv_list)} options [y/n] if you want to set "
@@ -174,38 +256,68 @@ class URDF:
                 ).lower()
                 environ[optenv_variable] = str(1 if answer == "y" else 0)
 
-        # After setting the environ variables, parse the file again using xacro
-        return ElementTree.fromstring(process_xacro_file(file).toxml())
-
 
 class Workspace:
-    XACRO_IN_LAUNCH_REGEX = compile(r"\$\(find\s(\S+)\)(\S+\.xacro|\.urdf)")
-
-    def __init__(self, workspace_folder: Path) -> None:
+    def __init__(
+        self,
+        workspace_folder: Path,
+        documents: DocumentCache | None = None,
+        ignored_directories: Iterable[str] = DEFAULT_IGNORED_DIRECTORIES,
+    ) -> None:
         self.workspace_folder = workspace_folder
+        self.documents = documents if documents is not None else DocumentCache()
+        self.graph = URDF.create_dependency_graph(self.documents)
+        self.ignored_directories = tuple(ignored_directories)
+
+        self._files: FileIndex | None = None
+        self._world_scans: dict[Path, tuple[int, int, WorldScan]] = {}
+        self._lock = Lock()
+
+    @property
+    def files(self) -> FileIndex:
+        with self._lock:
+            if self._files is None:
+                self._files = FileIndex(self.workspace_folder, self.ignored_directories)
+
+        return self._files
+
+    def invalidate(self, files: Iterable[Path]) -> None:
+        """
+        Forgets everything that was read from the given files and from the files that depend on them, so changed files
+        are read again. The file index is created again, because files could be added or removed.
+        """
+        for file in files:
+            for dependent in [file, *self.graph.dependents(file)]:
+                self.documents.invalidate(dependent)
+                self.graph.invalidate(dependent)
+
+        with self._lock:
+            self._files = None
+            for file in files:
+                self._world_scans.pop(file, None)
 
     def get_all_used_model_files(self) -> list[Path]:
         model_files = {}
         used_model_files = []
 
-        for model_sdf in self.workspace_folder.glob("**/model.sdf"):
+        for model_sdf in self.files.find_by_name("model.sdf"):
             root = model_sdf.parents[0]
             model_files[root.name] = model_sdf
 
-        for world_file in self.workspace_folder.glob("**/*.world"):
+        for world_file in self.files.find_by_extension(".world"):
             try:
-                world_root = ElementTree.parse(world_file).getroot()
-            except:
+                world_scan = self.scan_world_file(world_file)
+            except (OSError, ElementTree.ParseError):
                 print(f"Skipping non parseable world file {world_file}")
                 continue
 
             used_model_files.append(world_file)
 
-            for tag in world_root.findall(".//include/uri"):
-                model_name_match = search(r"model:\/\/(.+)", tag.text)
+            for uri in world_scan.include_uris:
+                model_name_match = search(r"model:\/\/(.+)", uri)
 
                 if model_name_match is None:
-                    raise SyntaxError(f"Cannot parse model {tag.text}")
+                    raise SyntaxError(f"Cannot parse model {uri}")
 
                 model_name = model_name_match.group(1)
 
@@ -221,57 +333,93 @@ class Workspace:
 
         return used_model_files
 
-    def get_all_dependend_packages(self) -> list[str]:
-        used_packages = []
+    def scan_world_file(self, file: Path) -> WorldScan:
+        """
+        Returns the included models, uris and material names of a world or model file, which is only read again when
+        the file changes.
+        """
+        file_stat = file.stat()
 
-        for launch_file in self.workspace_folder.glob("**/*.launch"):
-            for xacro_or_urdf_file in finditer(
-                Workspace.XACRO_IN_LAUNCH_REGEX, launch_file.read_text(encoding="utf-8")
-            ):
-                package_name = xacro_or_urdf_file.group(1)
-                file_path = xacro_or_urdf_file.group(2)
+        with self._lock:
+            mtime, size, world_scan = self._world_scans.get(file, (None, None, None))
 
-                used_packages.append(package_name)
+        if world_scan is None or mtime != file_stat.st_mtime_ns or size != file_stat.st_size:
+            world_scan = scan_world_file(file)
 
-                try:
-                    xacro_or_urdf_path = Path(RosPack().get_path(package_name)) / file_path[1:]
+            with self._lock:
+                self._world_scans[file] = (file_stat.st_mtime_ns, file_stat.st_size, world_scan)
+
+        return world_scan
 
-                    if not xacro_or_urdf_path.is_file():
-                        raise FileNotFoundError(f"Could not resolve file {xacro_or_urdf_path} in {launch_file}")
+    def get_all_dependend_packages(self) -> list[str]:
+        used_packages = []
 
-                    urdf = URDF(xacro_or_urdf_path)
-                    used_packages.extend(urdf.get_all_dependend_packages())
+        for reference in self.get_robot_descriptions():
+            # Files outside of all packages do not add a package
+            if reference.package:
+                used_packages.append(reference.package)
 
-                except ResourceNotFound as e:
-                    print(f"Could not find resource '{package_name}'!")
-                    raise ResourceNotFound from e
+            used_packages.extend(self.graph.get_dependencies(reference.file)[0])
 
         return list(set(used_packages))
 
     def get_all_used_xacro_files(self) -> list[URDF]:
-        used_xacro_urdf_files = []
+        """
+        Returns the records of the used xacro and URDF files. Files that are used by multiple robot descriptions are
+        only read once and returned once.
+        """
+        used_files = {}
 
-        for launch_file in self.workspace_folder.glob("**/*.launch"):
-            for xacro_or_urdf_file in finditer(
-                Workspace.XACRO_IN_LAUNCH_REGEX, launch_file.read_text(encoding="utf-8")
-            ):
-                package_name = xacro_or_urdf_file.group(1)
-                file_path = xacro_or_urdf_file.group(2)
+        for reference in self.get_robot_descriptions():
+            used_files[reference.file] = None
 
-                try:
-                    xacro_or_urdf_path = Path(RosPack().get_path(package_name)) / file_path[1:]
+            for used_file in self.graph.get_dependencies(reference.file)[1]:
+                if used_file.suffix in _URDF_EXTENSIONS:
+                    used_files[used_file] = None
+
+        return [URDF.get(f, self.graph) for f in used_files]
+
+    def get_robot_descriptions(self) -> list[LaunchReference]:
+        """
+        Returns the xacro and URDF files that are used by the launch files that are reachable from the launch file
+        that starts the simulation. All launch files in the workspace are used if that launch file does not exist.
+        """
+        entry_file = Path(package_resolver.get_path("virtual_maize_field")) / ENTRY_LAUNCH_FILE
+        entry_files = [entry_file] if entry_file.is_file() else self.files.find_by_extension(".launch")
+        references = launch_graph.get_references(entry_files)
+
+        for reference in references:
+            if not reference.file.is_file():
+                raise FileNotFoundError(f"Could not resolve file {reference.file} in {reference.launch_file}")
+
+        return references
+
+    def get_used_environment_variables(self) -> set[str]:
+        """
+        Returns the environment variables that are read by the xacro files that were used so far.
+        """
+        variables = set()
+
+        for node in self.graph.nodes:
+            if node.file.suffix == ".xacro":
+                variables.update(ENVIRONMENT_REGEX.findall(node.file.read_text(encoding="utf-8")))
+
+        return variables
 
-                    if not xacro_or_urdf_path.is_file():
-                        raise FileNotFoundError(f"Could not resolve file {xacro_or_urdf_path} in {launch_file}")
+    def get_used_material_names(self) -> set[str]:
+        """
+        Returns the names of the Gazebo materials that are used by the world and model files and the robot.
+        """
+        material_names = set()
 
-                    urdf = URDF(xacro_or_urdf_path)
-                    used_xacro_urdf_files.extend(urdf.get_all_dependend_xacro_or_urdf_files())
+        for model_file in self.get_all_used_model_files():
+            material_names.update(self.scan_world_file(model_file).material_names)
 
-                except ResourceNotFound as e:
-                    print(f"Could not find resource '{package_name}'!")
-                    raise ResourceNotFound from e
+        for urdf in self.get_all_used_xacro_files():
+            material_names.update(urdf.material_names)
 
-        return list(set(used_xacro_urdf_files))
+        material_names.discard("")
+        return material_names
 
     @staticmethod
     def get_material_resource_folder() -> Path:
@@ -290,7 +438,7 @@ class Workspace:
     @classmethod
     def resolve(cls) -> Workspace:
         try:
-            workspace_src_folder = Path(rospkg.RosPack().get_path("virtual_maize_field"))
+            workspace_src_folder = Path(package_resolver.get_path("virtual_maize_field"))
 
             # Try to resolve the 'src' folder recursively
             max_depth = 10
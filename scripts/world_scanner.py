@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from xml.etree.ElementTree import XMLParser
+
+from profiler import profiler
+
+_READ_SIZE = 64 * 1024
+
+
+@dataclass
+class WorldScan:
+    include_uris: list[str] = field(default_factory=list)  # Uris of the included models, without duplicates
+    uris: list[str] = field(default_factory=list)  # All uris, like meshes and material scripts, without duplicates
+    material_names: list[str] = field(default_factory=list)  # Names of the used material scripts
+    has_empty_materials: bool = False  # Whether the file contains empty <materials></materials> tags
+
+
+class _WorldScanTarget:
+    """
+    Parser target that receives the elements of a world file one by one, without building a tree. Only the tags of
+    the open elements and the text of the current element are kept.
+    """
+
+    def __init__(self) -> None:
+        self.include_uris: dict[str, None] = {}
+        self.uris: dict[str, None] = {}
+        self.material_names: dict[str, None] = {}
+        self.has_empty_materials = False
+
+        self._tags: list[str] = []
+        self._texts: list[list[str] | str] = []  # Text of the open elements, which is fixed when a child starts
+
+    def start(self, tag: str, attrib: dict[str, str]) -> None:
+        # Like the text of an element in a tree, only the text before the first child is used
+        if self._texts and isinstance(self._texts[-1], list):
+            self._texts[-1] = "".join(self._texts[-1])
+
+        self._tags.append(tag)
+        self._texts.append([])
+
+    def data(self, data: str) -> None:
+        if isinstance(self._texts[-1], list):
+            self._texts[-1].append(data)
+
+    def end(self, tag: str) -> None:
+        self._tags.pop()
+        text = self._texts.pop()
+        text = "".join(text) if isinstance(text, list) else text
+        parent_tag = self._tags[-1] if self._tags else None
+
+        if tag == "uri" and text.strip():
+            self.uris[text.strip()] = None
+            if parent_tag == "include":
+                self.include_uris[text.strip()] = None
+
+        # Only scripts of materials contain material names, other scripts are plugins
+        elif tag == "name" and parent_tag == "script" and len(self._tags) > 1 and self._tags[-2] == "material":
+            if text.strip():
+                self.material_names[text.strip()] = None
+
+        elif tag == "materials" and not text:
+            self.has_empty_materials = True
+
+    def close(self) -> WorldScan:
+        return WorldScan(list(self.include_uris), list(self.uris), list(self.material_names), self.has_empty_materials)
+
+
+def scan_world_file(file: Path) -> WorldScan:
+    """
+    Reads the included models, uris and material names of a world or model file in a single pass. The file is parsed
+    as a stream without building a tree, so the memory usage does not depend on the number of elements, like the
+    thousands of plants in a generated world.
+    """
+    parser = XMLParser(target=_WorldScanTarget())
+
+    with profiler.span("world", str(file)), open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(_READ_SIZE), b""):
+            parser.feed(chunk)
+
+        return parser.close()
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from hashlib import sha256
+from os import environ
+from pathlib import Path
+from re import compile
+from threading import Lock
+from types import ModuleType
+
+from disk_cache import read_json, write_json
+
+CACHE_VERSION = 1
+MAX_VARIANTS = 8  # Number of expansions with different includes or environment that are kept per xacro file
+ENVIRONMENT_REGEX = compile(r"\$\((?:optenv|env)\s+([^\s)]+)")
+ENVIRONMENT_VARIABLES = ("ROS_PACKAGE_PATH", "ROS_DISTRO")  # Variables that always influence the expansion
+
+# xacro keeps its file stack and included files in module globals, so only one file is expanded at a time
+_XACRO_LOCK = Lock()
+
+
+class XacroCache:
+    """
+    Persistent cache of expanded xacro files. The cache entry of a xacro file is found by its path and content hash.
+    An entry holds expansions of that file, each with the content hashes of all files it included and the values of
+    the environment variables read by those files. An expansion is only used if all of these still match.
+    """
+
+    def __init__(self, use_cache: bool = True) -> None:
+        self.use_cache = use_cache
+        self.hits = 0
+        self.misses = 0
+
+        self._hashes: dict[Path, tuple[int, int, str]] = {}
+        self._lock = Lock()
+
+    def expand(self, file: Path) -> str:
+        if not self.use_cache:
+            with _XACRO_LOCK:
+                return _import_xacro().process_file(str(file)).toxml()
+
+        cache_name = f"xacro/{self._get_key(file)}.json"
+        cache = read_json(cache_name)
+        variants = cache["variants"] if isinstance(cache, dict) and cache.get("version") == CACHE_VERSION else []
+
+        for variant in variants:
+            if self._is_valid_variant(variant):
+                self.hits += 1
+                return variant["output"]
+
+        self.misses += 1
+        xacro = _import_xacro()
+
+        # Included files are collected by xacro in a module wide list, which is only sliced while holding the lock
+        with _XACRO_LOCK:
+            all_includes = getattr(xacro, "all_includes", [])
+            include_count = len(all_includes)
+            output = xacro.process_file(str(file)).toxml()
+            includes = [Path(f).resolve() for f in all_includes[include_count:]]
+
+        variant = self._create_variant([file.resolve(), *includes], output)
+        if variant is not None:
+            write_json(cache_name, {"version": CACHE_VERSION, "variants": [variant, *variants][:MAX_VARIANTS]})
+
+        return output
+
+    def _create_variant(self, files: Iterable[Path], output: str) -> dict | None:
+        environment = {variable: environ.get(variable) for variable in ENVIRONMENT_VARIABLES}
+        hashes = {}
+
+        try:
+            for file in dict.fromkeys(files):
+                hashes[str(file)] = self.get_hash(file)
+
+                for variable in ENVIRONMENT_REGEX.findall(file.read_text(encoding="utf-8")):
+                    environment[variable] = environ.get(variable)
+
+        except (OSError, UnicodeDecodeError):
+            return None
+
+        return {"hashes": hashes, "environment": environment, "output": output}
+
+    def _is_valid_variant(self, variant: dict) -> bool:
+        for variable, value in variant["environment"].items():
+            if environ.get(variable) != value:
+                return False
+
+        for file, file_hash in variant["hashes"].items():
+            try:
+                if self.get_hash(Path(file)) != file_hash:
+                    return False
+            except OSError:
+                return False
+
+        return True
+
+    def _get_key(self, file: Path) -> str:
+        resolved_file = file.resolve()
+        return sha256(f"{resolved_file}\0{self.get_hash(resolved_file)}".encode("utf-8")).hexdigest()
+
+    def get_hash(self, file: Path) -> str:
+        file_stat = file.stat()
+
+        with self._lock:
+            mtime, size, file_hash = self._hashes.get(file, (None, None, ""))
+
+        if mtime == file_stat.st_mtime_ns and size == file_stat.st_size:
+            return file_hash
+
+        file_hash = sha256(file.read_bytes()).hexdigest()
+
+        with self._lock:
+            self._hashes[file] = (file_stat.st_mtime_ns, file_stat.st_size, file_hash)
+
+        return file_hash
+
+
+def _import_xacro() -> ModuleType:
+    # Importing xacro takes a long time, so it is only imported when a file has to be expanded
+    import xacro
+
+    return xacro
+
+
+# Cache that is shared by all scripts
+xacro_cache = XacroCache()
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import struct
+import zlib
+from dataclasses import dataclass
+from hashlib import sha256
+from io import BytesIO
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO
+
+from profiler import profiler
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+COMPRESSION_LEVEL = 6
+SPOOL_SIZE = 16 * 1024 * 1024  # Compressed members larger than this are buffered in a temporary file
+
+_BUFFER_SIZE = 1024 * 1024
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP64_COUNT_LIMIT = 0xFFFF
+_DOS_TIME = 0  # 00:00:00
+_DOS_DATE = (0 << 9) | (1 << 5) | 1  # 1980-01-01, the first date a zip file can store
+_FILE_ATTRIBUTES = (0o100644 << 16) & 0xFFFFFFFF
+_UNIX_SYSTEM = 3
+_UTF8_FLAG = 0x800
+
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+_CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")
+_END_RECORD = struct.Struct("<4s4H2LH")
+_ZIP64_END_RECORD = struct.Struct("<4sQ2H2L4Q")
+_ZIP64_LOCATOR = struct.Struct("<4sLQL")
+
+
+@dataclass
+class CompressedMember:
+    """
+    A file that is compressed and ready to be written to a zip file. The compressed data is kept in a spooled
+    temporary file, so large files do not have to fit in memory.
+    """
+
+    name: str
+    method: int
+    crc: int
+    file_size: int
+    compressed_size: int
+    data: BinaryIO
+
+
+@dataclass
+class _CentralEntry:
+    name: bytes
+    flags: int
+    method: int
+    crc: int
+    file_size: int
+    compressed_size: int
+    offset: int
+
+
+def compress_file(file: Path, name: str, method: int = ZIP_DEFLATED) -> CompressedMember:
+    """
+    Reads and compresses a file as a stream. This can be run by multiple threads at the same time, because zlib
+    releases the GIL while compressing.
+    """
+    with profiler.span("zip", name, file.stat().st_size), open(file, "rb") as f:
+        return _compress(f, name, method)
+
+
+def compress_bytes(data: bytes, name: str, method: int = ZIP_DEFLATED) -> CompressedMember:
+    return _compress(BytesIO(data), name, method)
+
+
+def _compress(stream: BinaryIO, name: str, method: int) -> CompressedMember:
+    data = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -15) if method == ZIP_DEFLATED else None
+    crc = 0
+    file_size = 0
+
+    while True:
+        buffer = stream.read(_BUFFER_SIZE)
+        if not buffer:
+            break
+
+        crc = zlib.crc32(buffer, crc)
+        file_size += len(buffer)
+        data.write(compressor.compress(buffer) if compressor is not None else buffer)
+
+    if compressor is not None:
+        data.write(compressor.flush())
+
+    compressed_size = data.tell()
+    data.seek(0)
+
+    return CompressedMember(name, method, crc, file_size, compressed_size, data)
+
+
+class ZipWriter:
+    """
+    Writes a zip file with deterministic content: all entries get the same timestamp and permissions and no data that
+    depends on the system that created the file. Members are written in the order they are added and zip64 records
+    are only used when a size, offset or the number of entries requires it. The SHA-256 hash of the written file is
+    computed while writing.
+    """
+
+    def __init__(self, file: BinaryIO) -> None:
+        self.file = file
+        self.hash = sha256()
+
+        self._entries: list[_CentralEntry] = []
+        self._offset = 0
+
+    def write(self, member: CompressedMember) -> None:
+        name = member.name.encode("utf-8")
+        flags = 0 if member.name.isascii() else _UTF8_FLAG
+        zip64 = member.file_size >= _ZIP64_LIMIT or member.compressed_size >= _ZIP64_LIMIT
+
+        extra = struct.pack("<2H2Q", 1, 16, member.file_size, member.compressed_size) if zip64 else b""
+        self._entries.append(
+            _CentralEntry(
+                name, flags, member.method, member.crc, member.file_size, member.compressed_size, self._offset
+            )
+        )
+
+        self._write(
+            _LOCAL_HEADER.pack(
+                b"PK\x03\x04",
+                self._get_version(member.method, zip64),
+                flags,
+                member.method,
+                _DOS_TIME,
+                _DOS_DATE,
+                member.crc,
+                _ZIP64_LIMIT if zip64 else member.compressed_size,
+                _ZIP64_LIMIT if zip64 else member.file_size,
+                len(name),
+                len(extra),
+            )
+            + name
+            + extra
+        )
+
+        while True:
+            buffer = member.data.read(_BUFFER_SIZE)
+            if not buffer:
+                break
+
+            self._write(buffer)
+
+        member.data.close()
+
+    def close(self) -> str:
+        """
+        Writes the central directory and returns the SHA-256 hash of the zip file.
+        """
+        central_directory_offset = self._offset
+
+        for entry in self._entries:
+            zip64_fields = [v for v in (entry.file_size, entry.compressed_size, entry.offset) if v >= _ZIP64_LIMIT]
+            extra = (
+                struct.pack(f"<2H{len(zip64_fields)}Q", 1, 8 * len(zip64_fields), *zip64_fields)
+                if zip64_fields
+                else b""
+            )
+            version = self._get_version(entry.method, len(zip64_fields) > 0)
+
+            self._write(
+                _CENTRAL_HEADER.pack(
+                    b"PK\x01\x02",
+                    (_UNIX_SYSTEM << 8) | version,
+                    version,
+                    entry.flags,
+                    entry.method,
+                    _DOS_TIME,
+                    _DOS_DATE,
+                    entry.crc,
+                    min(entry.compressed_size, _ZIP64_LIMIT),
+                    min(entry.file_size, _ZIP64_LIMIT),
+                    len(entry.name),
+                    len(extra),
+                    0,
+                    0,
+                    0,
+                    _FILE_ATTRIBUTES,
+                    min(entry.offset, _ZIP64_LIMIT),
+                )
+                + entry.name
+                + extra
+            )
+
+        central_directory_size = self._offset - central_directory_offset
+        entry_count = len(self._entries)
+
+        if (
+            entry_count >= _ZIP64_COUNT_LIMIT
+            or central_directory_offset >= _ZIP64_LIMIT
+            or central_directory_size >= _ZIP64_LIMIT
+        ):
+            zip64_end_offset = self._offset
+            self._write(
+                _ZIP64_END_RECORD.pack(
+                    b"PK\x06\x06",
+                    _ZIP64_END_RECORD.size - 12,
+                    (_UNIX_SYSTEM << 8) | 45,
+                    45,
+                    0,
+                    0,
+                    entry_count,
+                    entry_count,
+                    central_directory_size,
+                    central_directory_offset,
+                )
+            )
+            self._write(_ZIP64_LOCATOR.pack(b"PK\x06\x07", 0, zip64_end_offset, 1))
+
+        self._write(
+            _END_RECORD.pack(
+                b"PK\x05\x06",
+                0,
+                0,
+                min(entry_count, _ZIP64_COUNT_LIMIT),
+                min(entry_count, _ZIP64_COUNT_LIMIT),
+                min(central_directory_size, _ZIP64_LIMIT),
+                min(central_directory_offset, _ZIP64_LIMIT),
+                0,
+            )
+        )
+
+        return self.hash.hexdigest()
+
+    def _write(self, data: bytes) -> None:
+        self.file.write(data)
+        self.hash.update(data)
+        self._offset += len(data)
+
+    @staticmethod
+    def _get_version(method: int, zip64: bool) -> int:
+        if zip64:
+            return 45
+
+        return 20 if method == ZIP_DEFLATED else 10
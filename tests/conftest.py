@@ -0,0 +1,21 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The scripts import each other by module name, as they do when they are run from the scripts folder
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+import disk_cache  # noqa: E402
+from launch_graph import launch_graph  # noqa: E402
+from package_resolver import package_resolver  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def cache_folder(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    # Every test starts without the caches of earlier runs and tests
+    monkeypatch.setattr(disk_cache, "CACHE_FOLDER", tmp_path / "cache")
+    package_resolver.clear()
+    launch_graph.clear()
+
+    return tmp_path / "cache"
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+from asset_pruner import prune_plan
+from sync import CopyPlan
+from workspace import Workspace
+
+ROBOT_URDF = """<robot name="robot">
+  <link name="body"/>
+  <link name="wheel"/>
+  <gazebo reference="body">
+    <material>MyRobot/Body</material>
+  </gazebo>
+  <gazebo reference="wheel">
+    <material>
+      <script>
+        <uri>package://my_robot/materials/wheel</uri>
+        <name>MyRobot/Wheel</name>
+      </script>
+    </material>
+  </gazebo>
+</robot>"""
+
+
+def write_file(file: Path, content: str = "") -> None:
+    file.parent.mkdir(parents=True, exist_ok=True)
+    file.write_text(content)
+
+
+def get_material(name: str, texture: str) -> str:
+    return f"material {name}\n{{\n  technique {{ pass {{ texture_unit {{ texture {texture} }} }} }}\n}}\n"
+
+
+def write_package(folder: Path, name: str) -> Path:
+    write_file(folder / name / "package.xml", f"<package><name>{name}</name></package>")
+    return folder / name
+
+
+def test_materials_of_the_robot_package_are_kept(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    src = tmp_path / "src"
+    vmf = write_package(src, "virtual_maize_field")
+    write_file(
+        vmf / "launch/simulation.launch",
+        '<launch><param name="robot_description" textfile="$(find my_robot)/urdf/robot.urdf"/></launch>',
+    )
+    (vmf / "worlds").mkdir()
+
+    robot = write_package(src, "my_robot")
+    write_file(robot / "urdf/robot.urdf", ROBOT_URDF)
+    write_file(
+        robot / "materials/scripts/body.material",
+        get_material("MyRobot/Body", "body.png"),
+    )
+    write_file(robot / "materials/textures/body.png")
+    write_file(
+        robot / "materials/scripts/unused.material",
+        get_material("MyRobot/Unused", "unused.png"),
+    )
+    write_file(robot / "materials/textures/unused.png")
+    write_file(
+        robot / "materials/wheel/wheel.material",
+        get_material("MyRobot/Wheel", "wheel.png"),
+    )
+    write_file(robot / "materials/wheel/wheel.png")
+    write_file(robot / "meshes/unused.stl")
+    monkeypatch.setenv("ROS_PACKAGE_PATH", str(src))
+
+    plan = CopyPlan()
+    plan.add_tree(robot, "robot_packages/my_robot")
+    prune_plan(plan, Workspace(src))
+
+    assert sorted(str(dst) for dst in plan.files) == [
+        "robot_packages/my_robot/materials/scripts/body.material",
+        "robot_packages/my_robot/materials/textures/body.png",
+        "robot_packages/my_robot/materials/wheel/wheel.material",
+        "robot_packages/my_robot/materials/wheel/wheel.png",
+        "robot_packages/my_robot/package.xml",
+        "robot_packages/my_robot/urdf/robot.urdf",
+    ]
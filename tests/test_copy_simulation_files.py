@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from copy_simulation_files import get_staged_material_names
+from material_index import MaterialIndex
+from sync import CopyPlan
+from workspace import Workspace
+
+MODEL_SDF = """<sdf version="1.6">
+  <model name="box">
+    <link name="link">
+      <visual name="visual">
+        <material>
+          <script>
+            <uri>file://media/materials/scripts/gazebo.material</uri>
+            <name>Gazebo/Grass</name>
+          </script>
+        </material>
+      </visual>
+    </link>
+  </model>
+</sdf>"""
+MATERIALS = """material Gazebo/Grass
+{
+  technique { pass { texture_unit { texture grass.png } } }
+}
+"""
+
+
+def test_staged_model_loads_its_material(tmp_path: Path) -> None:
+    material_folder = tmp_path / "media/materials/scripts"
+    material_folder.mkdir(parents=True)
+    (material_folder / "gazebo.material").write_text(MATERIALS)
+    (material_folder / "grass.png").write_bytes(b"")
+    (material_folder / "unused.material").write_text("material Gazebo/Unused {}\n")
+
+    model_folder = tmp_path / "models/box"
+    model_folder.mkdir(parents=True)
+    (model_folder / "model.sdf").write_text(MODEL_SDF)
+
+    # The world does not use the model, but GZWeb loads every staged model
+    plan = CopyPlan()
+    plan.add_tree(model_folder, "gzweb/box")
+    material_names = get_staged_material_names(plan, Workspace(tmp_path))
+
+    assert material_names == {"Gazebo/Grass"}
+    assert MaterialIndex(material_folder, use_cache=False).get_files(material_names) == [
+        material_folder / "gazebo.material",
+        material_folder / "grass.png",
+    ]
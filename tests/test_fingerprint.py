@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from fingerprint import RunFingerprint
+
+
+def create_fingerprint(workspace: Path) -> RunFingerprint:
+    return RunFingerprint("simulation_files", [workspace], [], {"zip": None})
+
+
+def test_changed_file_in_used_package_outside_workspace(tmp_path: Path) -> None:
+    workspace = tmp_path / "workspace"
+    workspace.mkdir()
+    package = tmp_path / "opt/ros/share/robot_description"
+    (package / "meshes").mkdir(parents=True)
+    (package / "meshes/body.stl").write_text("solid body")
+
+    # The packages a run used are only known after the run
+    create_fingerprint(workspace).save(input_paths=[package])
+    assert create_fingerprint(workspace).is_up_to_date()
+
+    (package / "meshes/body.stl").write_text("solid changed body")
+    assert not create_fingerprint(workspace).is_up_to_date()
+
+
+def test_changed_file_in_workspace(tmp_path: Path) -> None:
+    workspace = tmp_path / "workspace"
+    workspace.mkdir()
+    (workspace / "robot.urdf").write_text("<robot/>")
+    create_fingerprint(workspace).save()
+    assert create_fingerprint(workspace).is_up_to_date()
+
+    (workspace / "robot.urdf").write_text("<robot name='changed'/>")
+    assert not create_fingerprint(workspace).is_up_to_date()
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+from mesh_scanner import get_invalid_texture_references, get_texture_references
+
+IMAGES = """
+<library_images>
+  <image id="grass"><init_from>../materials/textures/grass.png</init_from></image>
+</library_images>"""
+EFFECTS = """
+<library_effects>
+  <effect id="soil">
+    <image id="soil_image"><init_from>soil.jpg</init_from></image>
+    <profile_COMMON>
+      <newparam sid="soil_surface"><surface type="2D"><init_from>soil_image</init_from></surface></newparam>
+    </profile_COMMON>
+  </effect>
+</library_effects>"""
+GEOMETRIES = """
+<library_geometries>
+  <geometry id="plane"><mesh><source id="positions"><float_array count="3">0 0 0</float_array></source></mesh></geometry>
+</library_geometries>"""
+VISUAL_SCENES = """
+<library_visual_scenes><visual_scene id="scene"><node id="plane"/></visual_scene></library_visual_scenes>"""
+
+
+def write_mesh(folder: Path, *libraries: str, version: str = "1.4.1") -> Path:
+    mesh_file = folder / "mesh.dae"
+    mesh_file.write_text(
+        f'<COLLADA xmlns="http://www.collada.org/2005/11/COLLADASchema" version="{version}">'
+        f"{''.join(libraries)}</COLLADA>"
+    )
+    return mesh_file
+
+
+@pytest.mark.parametrize(
+    "libraries",
+    [
+        (EFFECTS, IMAGES, GEOMETRIES, VISUAL_SCENES),
+        (IMAGES, GEOMETRIES, EFFECTS, VISUAL_SCENES),
+        (GEOMETRIES, VISUAL_SCENES, IMAGES, EFFECTS),
+        (VISUAL_SCENES, EFFECTS, GEOMETRIES, IMAGES),
+    ],
+)
+def test_texture_references_in_any_library_order(tmp_path: Path, libraries: tuple[str, ...]) -> None:
+    mesh_file = write_mesh(tmp_path, *libraries)
+
+    assert sorted(get_texture_references(mesh_file)) == ["../materials/textures/grass.png", "soil.jpg"]
+    assert get_invalid_texture_references(mesh_file) == ["soil.jpg"]
+
+
+def test_texture_references_of_collada_1_5(tmp_path: Path) -> None:
+    images = """
+    <library_images>
+      <image id="grass"><init_from><ref>../materials/textures/grass.png</ref></init_from></image>
+    </library_images>"""
+    mesh_file = write_mesh(tmp_path, GEOMETRIES, images, version="1.5.0")
+
+    assert get_texture_references(mesh_file) == ["../materials/textures/grass.png"]
+
+
+def test_no_texture_references(tmp_path: Path) -> None:
+    mesh_file = write_mesh(tmp_path, GEOMETRIES, VISUAL_SCENES)
+
+    assert get_texture_references(mesh_file) == []
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+from validator import Validation, ValidationFeedback, ValidationResult
+from workspace import Workspace
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+@pytest.mark.parametrize("result", [ValidationResult.WARNING, ValidationResult.ERROR])
+def test_check_is_skipped_when_its_dependency_did_not_pass(tmp_path: Path, jobs: int, result: ValidationResult) -> None:
+    validation = Validation(use_cache=False)
+    ran = []
+
+    @validation.register
+    def check_resources(ws: Workspace) -> ValidationFeedback:
+        return ValidationFeedback(result, "Could not find resource")
+
+    @validation.register(depends_on=(check_resources,))
+    def check_plugins(ws: Workspace) -> ValidationFeedback:
+        ran.append(check_plugins)
+        return ValidationFeedback(ValidationResult.OK)
+
+    assert not validation.validate_all(Workspace(tmp_path), jobs=jobs, collect_all=True)
+    assert validation.feedback[check_plugins].result == ValidationResult.SKIPPED
+    assert not ran
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_failing_check_is_reported_as_error(tmp_path: Path, jobs: int) -> None:
+    validation = Validation(use_cache=False)
+
+    @validation.register
+    def check_files(ws: Workspace) -> ValidationFeedback:
+        raise FileNotFoundError("missing.stl")
+
+    @validation.register
+    def check_meshes(ws: Workspace) -> ValidationFeedback:
+        return ValidationFeedback(ValidationResult.OK)
+
+    assert not validation.validate_all(Workspace(tmp_path), jobs=jobs, collect_all=True)
+    assert validation.feedback[check_files].result == ValidationResult.ERROR
+    assert "missing.stl" in validation.feedback[check_files].msg
+    assert validation.feedback[check_meshes].result == ValidationResult.OK
+
+
+def test_saved_feedback_is_used_until_an_input_file_changes(tmp_path: Path) -> None:
+    validation = Validation()
+    robot_file = tmp_path / "robot.urdf"
+    robot_file.write_text("<robot/>")
+    ran = []
+
+    @validation.register(inputs=lambda ws: [robot_file])
+    def check_robot(ws: Workspace) -> ValidationFeedback:
+        ran.append(check_robot)
+        return ValidationFeedback(ValidationResult.OK, "Robot is valid")
+
+    validation.validate_all(Workspace(tmp_path))
+    validation.validate_all(Workspace(tmp_path))
+    assert len(ran) == 1
+    assert validation.feedback[check_robot].cached
+
+    robot_file.write_text("<robot name='changed'/>")
+    validation.validate_all(Workspace(tmp_path))
+    assert len(ran) == 2
+    assert not validation.feedback[check_robot].cached
+
+
+def test_feedback_that_did_not_pass_is_not_saved(tmp_path: Path) -> None:
+    validation = Validation()
+    ran = []
+
+    # The missing package can be installed without changing any input file
+    @validation.register(inputs=lambda ws: [])
+    def check_dependencies(ws: Workspace) -> ValidationFeedback:
+        ran.append(check_dependencies)
+        return ValidationFeedback(ValidationResult.WARNING, "Could not find resource 'pkg'")
+
+    validation.validate_all(Workspace(tmp_path))
+    validation.validate_all(Workspace(tmp_path))
+    assert len(ran) == 2